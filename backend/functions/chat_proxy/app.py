@@ -1,19 +1,88 @@
 import os
+import re
 import json
-import uuid
-import time
+import gzip
+import base64
 import boto3
-from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ConnectTimeoutError, ReadTimeoutError
+from assistiq import conversation_log
+from assistiq.queues import queue_from_env
+from assistiq.budget import TimeBudget, client_config
+from assistiq.fanout import FanoutTimeout
+from assistiq.degradation import controller_from_env
+from assistiq.catalog_snapshot import load_snapshot
+from assistiq.faq_keywords import KeywordMatcher, normalize
+from classifier import IntentClassifier
+from history_cache import HistoryCache
 
-lex_client = boto3.client("lexv2-runtime")
-dynamodb = boto3.resource("dynamodb")
+# Per-call cap on the Lex round trip (the invocation's remaining time caps it further);
+# delta history is skipped when less than HISTORY_MIN_SECONDS are left
+LEX_TIMEOUT_SECONDS = float(os.environ.get("LEX_TIMEOUT_SECONDS", "10"))
+HISTORY_MIN_SECONDS = float(os.environ.get("HISTORY_MIN_SECONDS", "1.0"))
+
+# botocore never resends an utterance on its own: a timed-out Lex call is
+# retried by the client with the same turn id (see lambda_handler)
+lex_client = boto3.client("lexv2-runtime", config=client_config(LEX_TIMEOUT_SECONDS, max_attempts=1))
+dynamodb = boto3.resource("dynamodb", config=client_config())
 
 BOT_ID = os.environ.get("BOT_ID")
 BOT_ALIAS_ID = os.environ.get("BOT_ALIAS_ID")
 BOT_LOCALE_ID = os.environ.get("BOT_LOCALE_ID", "en_US")
 LOGS_TABLE_NAME = os.environ.get("LOGS_TABLE_NAME", "AssistIQ-ChatLogs")
+LOGS_SESSION_INDEX = os.environ.get("LOGS_SESSION_INDEX", "SessionTurnsIndex")
+HISTORY_PAGE_SIZE = int(os.environ.get("HISTORY_PAGE_SIZE", "50"))
+HISTORY_MAX_PAGE_SIZE = 200
+# Bodies at least this large are gzip-compressed when the client accepts it
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", "1024"))
+
+# POST /chat response contract. v2 (default) is slim: sessionId, answer and
+# cursor, plus `messages` / `rawLex` only when asked for with ?history=1 /
+# ?rawLex=1. v1 (?v=1) is the legacy full body with both always included.
+RESPONSE_VERSION = 2
+_TRUTHY = {"1", "true", "yes"}
+# Turn ids a client may send back when retrying a timed-out turn
+_TURN_ID_RE = re.compile(r"^[A-Za-z0-9-]{1,64}$")
+_LEX_TIMEOUTS = (FanoutTimeout, ConnectTimeoutError, ReadTimeoutError)
+
+# Local fast path: answer only when the best label clears both the score
+# threshold and the margin over the runner-up; everything else goes to Lex.
+LOCAL_MIN_SCORE = float(os.environ.get("LOCAL_CLASSIFIER_MIN_SCORE", "0.7"))
+LOCAL_MIN_MARGIN = float(os.environ.get("LOCAL_CLASSIFIER_MIN_MARGIN", "0.25"))
+LOCAL_ANSWER_INTENTS = {"GreetingIntent", "ThanksIntent"}
+# A FAQ keyword hit is answered directly when its keywords cover this share of the message
+KEYWORD_MIN_COVERAGE = float(os.environ.get("FAQ_KEYWORD_MIN_COVERAGE", "0.6"))
+# An FAQ is answered locally only when it outscores every dialog intent by
+# this margin; "reset my password", an utterance of PasswordReset as much as
+# an FAQ keyword, goes to Lex so the intent's confirmation and closing flow
+# and surge counting still apply
+FAQ_MIN_INTENT_MARGIN = float(os.environ.get("FAQ_MIN_INTENT_MARGIN", "0.15"))
+_NON_DIALOG_INTENTS = LOCAL_ANSWER_INTENTS | {"FallbackIntent"}
+# Words that can answer a pending confirmation or closing question ("yes
+# thanks", "thank you it worked"); such messages always go to Lex unless the
+# session is known to have nothing pending
+_ANSWER_TOKENS = {
+    "yes", "yeah", "yep", "sure", "ok", "okay", "no", "nah", "nope", "cancel", "stop",
+    "worked", "fixed", "solved", "resolved", "still",
+}
 
 log_table = dynamodb.Table(LOGS_TABLE_NAME)
+# While DynamoDB throttles or errors, delta history is answered from the
+# cache only (no reads)
+degradation = controller_from_env().attach(dynamodb.meta.client)
+# Turn records are written behind through the log queue when it is configured
+log_queue = queue_from_env("LOG_QUEUE_URL", config=client_config()) if os.environ.get("LOG_QUEUE_URL") else None
+
+# Recent histories of the sessions this container serves, so delta history
+# for a hot session needs no read
+history_cache = HistoryCache(
+    max_sessions=int(os.environ.get("HISTORY_CACHE_SESSIONS", "1000")),
+    max_turns=int(os.environ.get("HISTORY_CACHE_TURNS", "100")),
+    ttl_seconds=int(os.environ.get("HISTORY_CACHE_TTL_SECONDS", "900")),
+)
+
+catalog_snapshot = load_snapshot()
+local_classifier = IntentClassifier.from_snapshot(catalog_snapshot) if catalog_snapshot else None
+faq_matcher = KeywordMatcher(catalog_snapshot.faqs()) if catalog_snapshot else None
 
 def _cors_headers():
     return {
@@ -23,91 +92,314 @@ def _cors_headers():
         "Access-Control-Allow-Headers": "*",
     }
 
-def _response(status_code, body):
+def _response(status_code, body, accept_encoding=""):
+    payload = json.dumps(body, separators=(",", ":"))
+    headers = _cors_headers()
+    if len(payload) >= COMPRESS_MIN_BYTES and "gzip" in (accept_encoding or "").lower():
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+        return {
+            "statusCode": status_code,
+            "headers": headers,
+            "body": base64.b64encode(gzip.compress(payload.encode("utf-8"))).decode("ascii"),
+            "isBase64Encoded": True,
+        }
     return {
         "statusCode": status_code,
-        "headers": _cors_headers(),
-        "body": json.dumps(body),
+        "headers": headers,
+        "body": payload,
+    }
+
+def _flag(params, name):
+    return (params.get(name) or "").lower() in _TRUTHY
+
+def _query_turns(session_id, after=None, limit=None, raise_errors=False):
+    return conversation_log.query_session_turns(
+        log_table, session_id, after=after, limit=limit, index_name=LOGS_SESSION_INDEX,
+        raise_errors=raise_errors,
+    )
+
+def _cache_turn(session_id, turn_id, turn_ts, user_text, bot_reply, new_session=False):
+    """Add a turn this container logged to the session's cached history."""
+    if not turn_ts:
+        return
+    item = {
+        "id": turn_id,
+        "turn_ts": turn_ts,
+        "timestamp": turn_ts[:19] + "Z",
+        "user_text": user_text,
+        "bot_reply": bot_reply,
     }
+    # A session minted by this request has no earlier turns anywhere
+    history_cache.add(session_id, [item], complete_after="" if new_session else None)
 
-def _scan_history(session_id):
-    items = []
+def _history_after(session_id, cursor, cached_only=False):
+    """Turns after the client's cursor, read from DynamoDB only where the cache has gaps.
+
+    With `cached_only`, None instead of reading.
+    """
+    cursor = cursor or ""
+    entry = history_cache.get(session_id)
+    if cached_only and (entry is None or not entry.covers(cursor)):
+        return None
     try:
-        resp = log_table.scan(FilterExpression=Attr("session_id").eq(session_id))
-        items.extend(resp.get("Items", []))
-        while "LastEvaluatedKey" in resp:
-            resp = log_table.scan(
-                FilterExpression=Attr("session_id").eq(session_id),
-                ExclusiveStartKey=resp["LastEvaluatedKey"]
-            )
-            items.extend(resp.get("Items", []))
+        if entry is None or cursor < entry.complete_after:
+            items, _ = _query_turns(session_id, after=cursor or None, raise_errors=True)
+            history_cache.add(session_id, items, complete_after=cursor)
+        elif not entry.covers(cursor):
+            # The client has seen turns logged by another container
+            after = entry.fetch_point(cursor)
+            items, _ = _query_turns(session_id, after=after or None, raise_errors=True)
+            history_cache.add(session_id, items, complete_after=after)
     except Exception as e:
-        print(f"[WARN] history scan failed for {session_id}: {e}")
-    items.sort(key=lambda x: x.get("timestamp", ""))
-    return items
+        print(f"[WARN] history query failed for {session_id}: {e}")
+        history_cache.forget(session_id)
+        return []
+    entry = history_cache.get(session_id)
+    return entry.after(cursor) if entry else []
+
+def _to_messages(items):
+    messages = []
+    for itm in items:
+        if "user_text" in itm:
+            messages.append({"role": "user", "content": itm["user_text"], "timestamp": itm.get("timestamp")})
+        if "bot_reply" in itm:
+            messages.append({"role": "bot", "content": itm["bot_reply"], "timestamp": itm.get("timestamp")})
+    return messages
+
+def _dialog_pending(session_id, user_text, new_session):
+    """True if fulfillment may be waiting on this message (a confirmation or closing answer)."""
+    if new_session:
+        return False
+    state = history_cache.dialog_state(session_id)
+    if state:
+        return True
+    # Unknown here (another container saw the last turn): anything that reads as an answer
+    return state is None and not _ANSWER_TOKENS.isdisjoint(normalize(user_text).split())
 
-def _log(session_id, user_text, bot_reply):
+def _remember_dialog_state(session_id, lex_resp):
+    attrs = (lex_resp.get("sessionState") or {}).get("sessionAttributes") or {}
+    # Absent with SESSION_STATE_BACKEND=dynamodb: the state stays unknown here
+    if conversation_log.DIALOG_STATE_ATTR in attrs:
+        history_cache.remember_dialog_state(session_id, attrs[conversation_log.DIALOG_STATE_ATTR])
+
+def _local_answer(user_text):
+    """(reply, intent_name, score) when the turn can be answered without Lex, else None."""
+    if local_classifier is None:
+        return None
+    scores = local_classifier.scores(user_text)
+    best_intent = max(
+        (v for k, v in scores.items() if not k.startswith("faq:") and k not in _NON_DIALOG_INTENTS),
+        default=0.0,
+    )
+
+    def faq_allowed(label):
+        return scores.get(label, 0.0) - best_intent >= FAQ_MIN_INTENT_MARGIN
+
+    if faq_matcher is not None:
+        matches = faq_matcher.match(user_text, top_k=1)
+        if (matches and matches[0]["answer"] and matches[0]["coverage"] >= KEYWORD_MIN_COVERAGE
+                and faq_allowed(f"faq:{matches[0]['id']}")):
+            return matches[0]["answer"], f"faq:{matches[0]['id']}", matches[0]["coverage"]
+    label, score, margin = local_classifier.classify(user_text, scores)
+    if label is None or score < LOCAL_MIN_SCORE or margin < LOCAL_MIN_MARGIN:
+        return None
+    if label in LOCAL_ANSWER_INTENTS:
+        # Same reply the fulfillment Lambda gives for these intents
+        item = catalog_snapshot.intent(label) or {}
+        reply = item.get("fulfillment") or item.get("initial_response")
+        return (reply, label, score) if reply else None
+    if label.startswith("faq:") and faq_allowed(label):
+        item = catalog_snapshot.get(label) or {}
+        return (item["answer"], label, score) if item.get("answer") else None
+    return None
+
+def _log(turn_id, session_id, user_text, bot_reply, lex_resp):
+    """Write the turn unless fulfillment already logged it; returns its turn_ts."""
+    session_state = lex_resp.get("sessionState") or {}
+    logged_ts = conversation_log.logged_turn_ts(session_state.get("sessionAttributes"), turn_id)
+    if logged_ts:
+        return logged_ts
+
+    interpretations = lex_resp.get("interpretations") or [{}]
+    confidence = (interpretations[0].get("nluConfidence") or {}).get("score")
+    return conversation_log.log_turn(
+        log_queue, log_table, turn_id, session_id,
+        user_text=user_text,
+        bot_reply=bot_reply,
+        intent_name=(session_state.get("intent") or {}).get("name"),
+        confidence=confidence,
+    )
+
+def _finished_turn(session_id, turn_id, budget):
+    """Lex's GetSession response if fulfillment already finished `turn_id`, else None.
+
+    A retry after a Lex timeout: Lex and fulfillment may have completed the
+    turn after the proxy gave up on it, and must not run it a second time.
+    """
     try:
-        log_table.put_item(
-            Item={
-                "session_id": session_id,
-                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
-                "user_text": user_text,
-                "bot_reply": bot_reply
-            }
-        )
+        session, = budget.run(lambda: lex_client.get_session(
+            botId=BOT_ID,
+            botAliasId=BOT_ALIAS_ID,
+            localeId=BOT_LOCALE_ID,
+            sessionId=session_id,
+        ), cap=LEX_TIMEOUT_SECONDS)
     except Exception as e:
-        print(f"[ERROR] log put_item failed: {e}")
+        # No session yet, or no answer: the turn is sent to Lex again
+        print(f"[WARN] get_session for retried turn {turn_id} failed:", e)
+        return None
+    attrs = (session.get("sessionState") or {}).get("sessionAttributes")
+    return session if conversation_log.logged_turn_ts(attrs, turn_id) else None
+
+def _request_attributes(turn_id, new_session):
+    attrs = {conversation_log.TURN_ID_ATTR: turn_id}
+    if new_session:
+        attrs[conversation_log.NEW_SESSION_ATTR] = "1"
+    return attrs
+
+def _history_page(event):
+    """GET /history?sessionId=...&cursor=...&limit=... for full reloads."""
+    params = event.get("queryStringParameters") or {}
+    session_id = params.get("sessionId")
+    if not session_id:
+        return _response(400, {"error": "Missing required parameter: sessionId"})
+    try:
+        limit = min(max(int(params.get("limit") or HISTORY_PAGE_SIZE), 1), HISTORY_MAX_PAGE_SIZE)
+    except ValueError:
+        return _response(400, {"error": "Invalid parameter: limit"})
+
+    items, more = _query_turns(session_id, after=params.get("cursor"), limit=limit)
+    last = items[-1].get("turn_ts") if items else params.get("cursor")
+    return _response(200, {
+        "version": RESPONSE_VERSION,
+        "sessionId": session_id,
+        "messages": _to_messages(items),
+        "cursor": last,
+        "nextCursor": last if more else None,
+    }, (event.get("headers") or {}).get("accept-encoding"))
+
+def _response_options(event):
+    params = event.get("queryStringParameters") or {}
+    legacy = params.get("v") == "1"
+    return {
+        "legacy": legacy,
+        "history": legacy or _flag(params, "history"),
+        "raw_lex": legacy or _flag(params, "rawLex"),
+        "accept_encoding": (event.get("headers") or {}).get("accept-encoding"),
+    }
+
+def _respond(session_id, bot_reply, turn_ts, cursor, lex_resp, opts, budget):
+    # Include 'answer' explicitly for the frontend
+    result = {
+        "version": 1 if opts["legacy"] else RESPONSE_VERSION,
+        "sessionId": session_id,
+        "answer": bot_reply or None,
+        "cursor": turn_ts or cursor,
+    }
+
+    # Delta history (opt-in): only the turns after the client's cursor.
+    # Without time for it, or a cached copy while DynamoDB is degraded, the
+    # cursor stays put, so the next call returns it.
+    history_items = None
+    if opts["history"] and budget.allows(HISTORY_MIN_SECONDS):
+        history_items = _history_after(session_id, cursor, cached_only=degradation.degraded())
+    if opts["history"] and history_items is None:
+        budget.degrade("history")
+        result["cursor"] = cursor
+    elif opts["history"]:
+        result["messages"] = _to_messages(history_items)
+        if history_items:
+            result["cursor"] = max(result["cursor"] or "", history_items[-1].get("turn_ts") or "") or None
+    if opts["raw_lex"]:
+        result["rawLex"] = lex_resp
+    if budget.degraded:
+        result["degraded"] = budget.degraded
+        budget.report(session_id=session_id)
+
+    return _response(200, result, opts["accept_encoding"])
 
 def lambda_handler(event, context):
     # Handle CORS preflight (OPTIONS)
-    if event.get("requestContext", {}).get("http", {}).get("method") == "OPTIONS":
+    method = event.get("requestContext", {}).get("http", {}).get("method")
+    if method == "OPTIONS":
         return _response(204, {})
+    if method == "GET":
+        return _history_page(event)
+
+    opts = _response_options(event)
+    budget = TimeBudget(context)
 
     try:
-        body = json.loads(event.get("body") or "{}")
+        raw_body = event.get("body") or "{}"
+        if event.get("isBase64Encoded"):
+            raw_body = base64.b64decode(raw_body).decode("utf-8")
+        body = json.loads(raw_body)
     except Exception:
         body = {}
 
     user_text = (body.get("text") or "").strip()
-    session_id = body.get("sessionId") or str(uuid.uuid4())
+    new_session = not body.get("sessionId")
+    session_id = body.get("sessionId") or conversation_log.new_session_id()
+    # Last turn_ts the client has already seen; only newer turns are returned.
+    cursor = body.get("cursor") or None
 
     if not BOT_ID or not BOT_ALIAS_ID:
         return _response(500, {"error": "Lex bot not configured."})
     if not user_text:
         return _response(400, {"error": "Missing required parameter: text"})
 
-    try:
-        lex_resp = lex_client.recognize_text(
-            botId=BOT_ID,
-            botAliasId=BOT_ALIAS_ID,
-            localeId=BOT_LOCALE_ID,
-            sessionId=session_id,
-            text=user_text,
+    # A client retrying a timed-out turn sends back the turnId from the 504
+    retry_turn = body.get("turnId")
+    if retry_turn is not None and not (isinstance(retry_turn, str) and _TURN_ID_RE.match(retry_turn)):
+        return _response(400, {"error": "Invalid parameter: turnId"})
+    turn_id = retry_turn or conversation_log.new_turn_id()
+
+    # Trivial turns (greetings, thanks, FAQ keywords) skip the Lex round trip,
+    # unless fulfillment is waiting for this session's answer
+    local = None if _dialog_pending(session_id, user_text, new_session) else _local_answer(user_text)
+    if local:
+        bot_reply, intent_name, score = local
+        turn_ts = conversation_log.log_turn(
+            log_queue, log_table, turn_id, session_id,
+            user_text=user_text, bot_reply=bot_reply,
+            intent_name=intent_name, confidence=round(score, 4),
         )
-    except Exception as e:
-        return _response(500, {"error": "Error calling Lex", "details": str(e)})
+        _cache_turn(session_id, turn_id, turn_ts, user_text, bot_reply, new_session)
+        return _respond(session_id, bot_reply, turn_ts, cursor, None, opts, budget)
+
+    lex_resp = _finished_turn(session_id, turn_id, budget) if retry_turn else None
+    if lex_resp is None:
+        try:
+            lex_resp, = budget.run(lambda: lex_client.recognize_text(
+                botId=BOT_ID,
+                botAliasId=BOT_ALIAS_ID,
+                localeId=BOT_LOCALE_ID,
+                sessionId=session_id,
+                text=user_text,
+                requestAttributes=_request_attributes(turn_id, new_session),
+            ), cap=LEX_TIMEOUT_SECONDS)
+        except _LEX_TIMEOUTS as e:
+            # Lex may still finish the turn; a retry with this turn id picks
+            # up the result instead of running it again (or logs it under
+            # the same id when it did not finish)
+            return _response(504, {
+                "error": "Lex did not answer in time",
+                "details": str(e),
+                "retryable": True,
+                "sessionId": session_id,
+                "turnId": turn_id,
+            })
+        except Exception as e:
+            return _response(500, {"error": "Error calling Lex", "details": str(e)})
 
     # Compose bot reply
     msg_chunks = [m.get("content", "") for m in lex_resp.get("messages", []) if m.get("content")]
     bot_reply = "\n".join(msg_chunks) if msg_chunks else ""
 
-    # Save to logs
-    _log(session_id, user_text, bot_reply)
+    _remember_dialog_state(session_id, lex_resp)
 
-    # Build history array
-    history_items = _scan_history(session_id)
-    messages = []
-    for itm in history_items:
-        if "user_text" in itm:
-            messages.append({"role": "user", "content": itm["user_text"], "timestamp": itm.get("timestamp")})
-        if "bot_reply" in itm:
-            messages.append({"role": "bot", "content": itm["bot_reply"], "timestamp": itm.get("timestamp")})
+    # Save to logs
+    turn_ts = _log(turn_id, session_id, user_text, bot_reply, lex_resp)
+    _cache_turn(session_id, turn_id, turn_ts, user_text, bot_reply, new_session)
 
-    # Include 'answer' explicitly for the frontend
-    return _response(200, {
-        "sessionId": session_id,
-        "answer": bot_reply or None,
-        "messages": messages,
-        "rawLex": lex_resp
-    })
+    return _respond(session_id, bot_reply, turn_ts, cursor, lex_resp, opts, budget)
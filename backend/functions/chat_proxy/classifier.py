@@ -0,0 +1,87 @@
+"""
+In-process fast-path intent classifier for the chat proxy.
+
+Built once per container from the catalog snapshot: every intent utterance
+(and every FAQ keyword phrase, labelled "faq:<id>") becomes a TF-IDF row over
+word uni/bigrams and character trigrams. A message is scored against all rows
+with one matrix-vector product; a label's score is its best row's cosine
+similarity. Callers answer locally only above a confidence threshold and
+hand everything else to Lex.
+"""
+import numpy as np
+from assistiq.faq_keywords import normalize
+
+def features(text):
+    """Word unigrams, word bigrams and boundary-padded character trigrams."""
+    words = normalize(text).split()
+    feats = list(words)
+    feats += [f"{a}_{b}" for a, b in zip(words, words[1:])]
+    for w in words:
+        padded = f"#{w}#"
+        feats += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+    return feats
+
+class IntentClassifier:
+    def __init__(self, examples):
+        """`examples` is a list of (label, text) pairs."""
+        self.labels = sorted({label for label, _ in examples})
+        label_index = {label: i for i, label in enumerate(self.labels)}
+        docs = [features(text) for _, text in examples]
+
+        vocab = {}
+        for doc in docs:
+            for f in doc:
+                vocab.setdefault(f, len(vocab))
+        self.vocab = vocab
+
+        df = np.zeros(len(vocab), dtype=np.float32)
+        for doc in docs:
+            df[[vocab[f] for f in set(doc)]] += 1
+        self.idf = np.log((1 + len(docs)) / (1 + df)).astype(np.float32) + 1.0
+
+        matrix = np.zeros((len(docs), len(vocab)), dtype=np.float32)
+        for row, doc in enumerate(docs):
+            for f in doc:
+                matrix[row, vocab[f]] += 1.0
+        self.matrix = self._weigh(matrix)
+        self.row_labels = np.array([label_index[label] for label, _ in examples], dtype=np.int32)
+
+    def _weigh(self, counts):
+        """Sublinear tf * idf, L2-normalised per row."""
+        weighted = np.where(counts > 0, 1.0 + np.log(np.maximum(counts, 1.0)), 0.0) * self.idf
+        norms = np.linalg.norm(weighted, axis=-1, keepdims=True)
+        return (weighted / np.maximum(norms, 1e-12)).astype(np.float32)
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        examples = []
+        for intent in snapshot.intents():
+            examples += [(intent["id"], u) for u in intent.get("utterances", []) if u]
+        for faq in snapshot.faqs():
+            examples += [(f"faq:{faq['id']}", k) for k in faq.get("q_keywords", []) if k]
+        return cls(examples)
+
+    def scores(self, text):
+        """Best cosine similarity per label, as a {label: score} dict."""
+        q = np.zeros(len(self.vocab), dtype=np.float32)
+        for f in features(text):
+            i = self.vocab.get(f)
+            if i is not None:
+                q[i] += 1.0
+        if not q.any():
+            return {}
+        sims = self.matrix @ self._weigh(q)
+        best = np.full(len(self.labels), -1.0, dtype=np.float32)
+        np.maximum.at(best, self.row_labels, sims)
+        return {label: float(best[i]) for i, label in enumerate(self.labels)}
+
+    def classify(self, text, scores=None):
+        """(label, score, margin over the runner-up label); label is None if nothing matched.
+
+        `scores` reuses a `scores(text)` result already computed by the caller.
+        """
+        ranked = sorted((self.scores(text) if scores is None else scores).items(), key=lambda kv: kv[1], reverse=True)
+        if not ranked or ranked[0][1] <= 0.0:
+            return None, 0.0, 0.0
+        runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+        return ranked[0][0], ranked[0][1], ranked[0][1] - runner_up
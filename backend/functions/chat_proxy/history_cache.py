@@ -0,0 +1,114 @@
+"""
+Warm-container cache of recent session histories for the chat proxy.
+
+An entry holds a session's turns oldest first, and `complete_after`: every
+turn with a later turn_ts is in the entry. The proxy adds each turn it logs,
+so a session whose turns keep landing on this container is answered from
+memory. The client's cursor (the last turn_ts it has seen) is the validity
+check: a cursor that is neither `complete_after` nor a cached turn means the
+client saw turns another container logged, and only the turns after the
+nearest cached one are read back.
+
+Bounded by sessions (LRU), turns per session (the oldest are dropped and
+`complete_after` moves up) and age since the entry was last updated.
+
+The cache also remembers each session's pending dialog state as last seen
+on a Lex response (the encoded `aiq_state` attribute), so the proxy does not
+answer locally a message fulfillment is waiting on.
+"""
+import time
+import bisect
+from collections import OrderedDict
+
+class _Entry:
+    __slots__ = ("turns", "complete_after", "updated_at")
+
+    def __init__(self, complete_after, now):
+        self.turns = []
+        self.complete_after = complete_after
+        self.updated_at = now
+
+    def timestamps(self):
+        return [t["turn_ts"] for t in self.turns]
+
+    def covers(self, cursor):
+        """True if every turn after `cursor` is in the entry."""
+        if cursor < self.complete_after:
+            return False
+        if cursor == self.complete_after:
+            return True
+        ts = self.timestamps()
+        i = bisect.bisect_left(ts, cursor)
+        return i < len(ts) and ts[i] == cursor
+
+    def fetch_point(self, cursor):
+        """Cursor to read missing turns from: the newest cached turn before `cursor`."""
+        ts = self.timestamps()
+        i = bisect.bisect_left(ts, cursor)
+        return max(ts[i - 1] if i else "", self.complete_after)
+
+    def after(self, cursor):
+        ts = self.timestamps()
+        return self.turns[bisect.bisect_right(ts, cursor):]
+
+class HistoryCache:
+    def __init__(self, max_sessions=1000, max_turns=100, ttl_seconds=900, clock=time.monotonic):
+        self.max_sessions = max_sessions
+        self.max_turns = max_turns
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._dialog = OrderedDict()
+
+    def get(self, session_id):
+        entry = self._entries.get(session_id)
+        if entry is None:
+            return None
+        if self.clock() - entry.updated_at > self.ttl_seconds:
+            del self._entries[session_id]
+            return None
+        self._entries.move_to_end(session_id)
+        return entry
+
+    def add(self, session_id, items, complete_after=None):
+        """Merge turns into the session's entry, creating it if needed.
+
+        `complete_after` says the items are every turn after that turn_ts; a
+        new entry without it only vouches for turns after its newest item.
+        """
+        items = [it for it in items if it.get("turn_ts")]
+        entry = self.get(session_id)
+        if entry is None:
+            if not items and complete_after is None:
+                return
+            start = complete_after if complete_after is not None else max(it["turn_ts"] for it in items)
+            entry = self._entries[session_id] = _Entry(start, self.clock())
+        elif complete_after is not None:
+            entry.complete_after = min(entry.complete_after, complete_after)
+
+        merged = {t["turn_ts"]: t for t in entry.turns}
+        merged.update((it["turn_ts"], it) for it in items)
+        entry.turns = [merged[ts] for ts in sorted(merged)]
+        if len(entry.turns) > self.max_turns:
+            dropped = entry.turns[:-self.max_turns]
+            entry.turns = entry.turns[-self.max_turns:]
+            entry.complete_after = max(entry.complete_after, dropped[-1]["turn_ts"])
+        entry.updated_at = self.clock()
+
+        self._entries.move_to_end(session_id)
+        while len(self._entries) > self.max_sessions:
+            self._entries.popitem(last=False)
+
+    def forget(self, session_id):
+        self._entries.pop(session_id, None)
+        self._dialog.pop(session_id, None)
+
+    def dialog_state(self, session_id):
+        """The session's last seen dialog state ("" for none), or None if unknown."""
+        return self._dialog.get(session_id)
+
+    def remember_dialog_state(self, session_id, state):
+        self._dialog[session_id] = state or ""
+        self._dialog.move_to_end(session_id)
+        while len(self._dialog) > self.max_sessions:
+            self._dialog.popitem(last=False)
@@ -0,0 +1,265 @@
+import os
+import json
+import boto3
+from datetime import datetime
+from assistiq import conversation_log
+from assistiq.queues import sqs_messages
+from assistiq.escalation_ledger import EscalationLedger
+from assistiq.budget import TimeBudget, client_config
+from rate_limit import TokenBucket
+import digest
+import transcript
+import similar
+
+# --- DynamoDB + SES Clients ---
+dynamodb = boto3.resource("dynamodb", config=client_config())
+chatlog_table = dynamodb.Table(os.environ["LOGS_TABLE_NAME"])
+ses_client = boto3.client("ses", region_name="us-east-1", config=client_config())
+
+SESSION_INDEX_NAME = os.environ.get("LOGS_SESSION_INDEX", "SessionTurnsIndex")
+SOURCE_EMAIL = os.environ["SOURCE_EMAIL"]
+SUPPORT_EMAIL = os.environ["SUPPORT_EMAIL"]
+
+# One ticket per (session, issue) per window; repeats are appended to it
+ledger = EscalationLedger(
+    dynamodb.Table(os.environ["ESCALATION_LEDGER_TABLE"]),
+    window_seconds=int(os.environ.get("ESCALATION_WINDOW_SECONDS", "3600")),
+)
+
+# Urgent issues are emailed at once; everything else waits for a digest
+URGENT_INTENTS = {i.strip() for i in os.environ.get("URGENT_ESCALATION_INTENTS", "AccountLocked,UserRequest").split(",") if i.strip()}
+# Optional issue_type -> recipient routing, e.g. {"VPNIssue": "netops@example.com"}
+ESCALATION_ROUTES = json.loads(os.environ.get("ESCALATION_ROUTES") or "{}")
+DIGEST_TEMPLATE_NAME = os.environ.get("DIGEST_TEMPLATE_NAME", "AssistIQ-EscalationDigest")
+DIGEST_MAX_SIZE = int(os.environ.get("DIGEST_MAX_SIZE", "20"))
+# Longer transcripts are attached gzipped; the body keeps the most recent turns
+TRANSCRIPT_BODY_TURNS = int(os.environ.get("TRANSCRIPT_BODY_TURNS", "20"))
+DIGEST_READ_TIMEOUT = float(os.environ.get("DIGEST_READ_TIMEOUT_SECONDS", "10"))
+# Longest wait for SES send capacity; the invocation's remaining time caps it further
+SEND_WAIT_SECONDS = float(os.environ.get("SES_SEND_WAIT_SECONDS", "5"))
+# A queued escalation is only started with this much of the invocation left;
+# the rest of the batch is reported failed and redelivered by SQS
+ESCALATION_MIN_SECONDS = float(os.environ.get("ESCALATION_MIN_SECONDS", "8"))
+
+def _send_rate():
+    """This container's share of the SES send rate (emails per second)."""
+    if os.environ.get("SES_MAX_SEND_RATE"):
+        return float(os.environ["SES_MAX_SEND_RATE"])
+    try:
+        rate = float(ses_client.get_send_quota()["MaxSendRate"])
+    except Exception as e:
+        print("[WARN] get_send_quota failed, assuming 1 email/s:", e)
+        rate = 1.0
+    return max(rate / int(os.environ.get("WORKER_CONCURRENCY", "1")), 0.1)
+
+send_bucket = TokenBucket(_send_rate())
+
+# Past escalations, indexed by MinHash/LSH so new tickets can list similar ones
+SIMILAR_TOP_K = int(os.environ.get("SIMILAR_TOP_K", "3"))
+if os.environ.get("SIMILAR_TICKETS_TABLE") and os.environ.get("SIMILAR_BUCKETS_TABLE"):
+    similar_store = similar.DynamoLSHStore(
+        dynamodb.Table(os.environ["SIMILAR_TICKETS_TABLE"]),
+        dynamodb.Table(os.environ["SIMILAR_BUCKETS_TABLE"]),
+        dynamodb,
+    )
+else:
+    print("[WARN] SIMILAR_TICKETS_TABLE / SIMILAR_BUCKETS_TABLE not set; similar tickets are kept in memory")
+    similar_store = similar.LocalLSHStore()
+
+# ================== Email Helpers ==================
+
+def session_turns(session_id):
+    """A session's turns, oldest first, streamed page by page from the session index."""
+    return conversation_log.iter_session_turns(chatlog_table, session_id, index_name=SESSION_INDEX_NAME)
+
+def recipient_for(issue_type):
+    return ESCALATION_ROUTES.get(issue_type, SUPPORT_EMAIL)
+
+def similar_ticket_id(ticket):
+    """Index key of a ledger ticket; ledger ids repeat across windows, this does not."""
+    return f"{ticket['id']}@{int(ticket['opened_at'])}"
+
+def find_similar(collector, exclude=None):
+    """Most similar past tickets for the shingles collected from a transcript."""
+    try:
+        sig = similar.signature(collector.shingles)
+        return similar_store.query(sig, k=SIMILAR_TOP_K, exclude=exclude) if sig is not None else []
+    except Exception as e:
+        print("similar ticket lookup error:", e)
+        return []
+
+def index_ticket(ticket_id, session_id, issue_type, collector):
+    """Add a sent ticket to the similarity index."""
+    try:
+        sig = similar.signature(collector.shingles)
+        if sig is not None:
+            similar_store.add(ticket_id, sig, {
+                "session_id": session_id,
+                "issue_type": issue_type,
+                "summary": collector.summary or "",
+                "created_at": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
+            })
+    except Exception as e:
+        print(f"similar ticket index error for {ticket_id}:", e)
+
+def send_escalation_email(turns, session_id, issue_type="General Issue", ticket_id=None, budget=None):
+    """Send the transcript to IT via SES raw email; returns the SES MessageId, or None."""
+    budget = budget or TimeBudget()
+    recipient = recipient_for(issue_type)
+    collector = similar.ShingleCollector()
+    raw = transcript.build_message(
+        collector.watch(turns),
+        subject=f"AssistIQ Escalation: {issue_type} (Session {session_id})",
+        source=SOURCE_EMAIL,
+        recipient=recipient,
+        header={
+            "Session ID": session_id,
+            "Timestamp": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S UTC"),
+            "Issue Type": issue_type,
+        },
+        body_turns=TRANSCRIPT_BODY_TURNS,
+        attachment_name=f"assistiq-transcript-{session_id}.txt.gz",
+        related=lambda: find_similar(collector, exclude=ticket_id),
+    )
+
+    if not send_bucket.acquire(timeout=budget.timeout(SEND_WAIT_SECONDS)):
+        print("SES send rate exhausted; escalation will be retried")
+        return None
+    try:
+        resp = ses_client.send_raw_email(
+            Source=SOURCE_EMAIL,
+            Destinations=[recipient],
+            RawMessage={"Data": raw},
+        )
+    except Exception as e:
+        print("SES escalation send error:", e)
+        return None
+    if ticket_id:
+        index_ticket(ticket_id, session_id, issue_type, collector)
+    return resp.get("MessageId")
+
+# ================== Worker ==================
+
+def process_escalation(message, budget=None):
+    """Open a ticket for one queued escalation and email it to IT.
+
+    If a ticket for the same session and issue is already open, the
+    escalation is appended to it and nothing is sent. Non-urgent tickets
+    are queued for their recipient's digest.
+    """
+    session_id = message["session_id"]
+    issue_type = message.get("issue_type") or "General Issue"
+    turn_id = message.get("turn_id") or message.get("requested_at") or "unknown"
+
+    urgent = issue_type in URGENT_INTENTS or bool(message.get("urgent"))
+    ticket = ledger.open(session_id, issue_type, turn_id,
+                         digest_recipient=None if urgent else recipient_for(issue_type))
+    if ticket is None:
+        appended = ledger.append(session_id, issue_type, turn_id)
+        print(f"Escalation {session_id}/{issue_type} already open;",
+              "appended turn" if appended else "duplicate turn ignored")
+        return True
+    if not urgent:
+        # Queued for the recipient's next digest
+        return True
+
+    try:
+        message_id = send_escalation_email(session_turns(session_id), session_id, issue_type=issue_type,
+                                           ticket_id=similar_ticket_id(ticket), budget=budget)
+    except Exception as e:
+        print("transcript read error:", e)
+        message_id = None
+    if message_id:
+        ledger.mark_sent(ticket["id"], message_id)
+        return True
+    ledger.mark_failed(ticket["id"])
+    return False
+
+def flush_digests(recipients, budget=None):
+    """Send each recipient's queued tickets as one digest; returns tickets sent."""
+    budget = budget or TimeBudget()
+    destinations, tickets_by_recipient = [], {}
+    for recipient in recipients:
+        # Only tickets this flush claimed; a concurrent flush sends the others
+        tickets = [t for t in ledger.queued(recipient, limit=digest.MAX_BULK_DESTINATIONS)
+                   if ledger.claim_digest(t["id"])]
+        if not tickets:
+            continue
+        collectors = [similar.ShingleCollector() for _ in tickets]
+        try:
+            # The tickets' transcripts are read concurrently
+            entries = budget.run(*[
+                lambda t=t, c=c: digest.ticket_entry(t, c.watch(session_turns(t["session_id"])))
+                for t, c in zip(tickets, collectors)
+            ], cap=DIGEST_READ_TIMEOUT)
+        except Exception as e:
+            print(f"digest transcript read error for {recipient}:", e)
+            for t in tickets:
+                ledger.release_digest(t["id"])
+            continue
+        # Looked up once the transcripts' shingles are collected; skipped
+        # rather than cutting into the time the send needs
+        for entry, ticket, collector in zip(entries, tickets, collectors):
+            related = []
+            if budget.allows(ESCALATION_MIN_SECONDS):
+                related = find_similar(collector, exclude=similar_ticket_id(ticket))
+            entry["similar"] = [digest.similar_entry(t, score) for t, score in related]
+        destinations.append(digest.destination(recipient, entries))
+        tickets_by_recipient[recipient] = list(zip(tickets, collectors))
+    if not destinations:
+        return 0
+
+    delivered = digest.send_digests(ses_client, send_bucket, DIGEST_TEMPLATE_NAME, SOURCE_EMAIL, destinations,
+                                    budget=budget, send_wait=SEND_WAIT_SECONDS)
+    sent = 0
+    for recipient, claimed in tickets_by_recipient.items():
+        message_id = delivered.get(recipient)
+        for ticket, collector in claimed:
+            if message_id is None:
+                # Not sent: back in the queue for the next flush
+                ledger.release_digest(ticket["id"])
+                continue
+            ledger.mark_sent(ticket["id"], message_id)
+            index_ticket(similar_ticket_id(ticket), ticket["session_id"], ticket["issue_type"], collector)
+            sent += 1
+    return sent
+
+def lambda_handler(event, context):
+    """SQS-triggered: failed messages are reported back so only they are retried.
+
+    The digest schedule invokes the same handler without `Records`.
+    """
+    budget = TimeBudget(context)
+    if "Records" not in event:
+        recipients = {SUPPORT_EMAIL, *ESCALATION_ROUTES.values()}
+        return {"digestTicketsSent": flush_digests(recipients, budget)}
+
+    failures = []
+    touched = set()
+    deferred = 0
+    for message_id, message in sqs_messages(event):
+        if not budget.allows(ESCALATION_MIN_SECONDS):
+            # Redelivered by SQS rather than cut off mid-send
+            failures.append({"itemIdentifier": message_id})
+            deferred += 1
+            continue
+        try:
+            ok = process_escalation(message, budget)
+        except Exception as e:
+            print("process_escalation error:", e)
+            ok = False
+        if not ok:
+            failures.append({"itemIdentifier": message_id})
+        elif message.get("issue_type") not in URGENT_INTENTS and not message.get("urgent"):
+            touched.add(recipient_for(message.get("issue_type")))
+    if deferred:
+        print(f"[WARN] time budget low; {deferred} escalations deferred")
+
+    # Size threshold: don't wait for the schedule once a digest is full
+    full = [r for r in touched if len(ledger.queued(r, limit=DIGEST_MAX_SIZE)) >= DIGEST_MAX_SIZE]
+    if full and budget.allows(ESCALATION_MIN_SECONDS):
+        try:
+            flush_digests(full, budget)
+        except Exception as e:
+            print("flush_digests error:", e)
+    return {"batchItemFailures": failures}
@@ -0,0 +1,85 @@
+"""
+Escalation digests: non-urgent tickets queued in the ledger are sent as one
+email per recipient, on the digest schedule or as soon as a recipient has
+DIGEST_MAX_SIZE tickets waiting.
+
+All recipients' digests go out through SendBulkTemplatedEmail against the
+EscalationDigest SES template (sam-template.yaml), one destination per
+recipient with its own template data, paced by the send-rate token bucket.
+Each ticket lists its most similar past tickets, as urgent emails do.
+"""
+import json
+from collections import deque
+from datetime import datetime
+
+# SendBulkTemplatedEmail accepts at most 50 destinations per call
+MAX_BULK_DESTINATIONS = 50
+EXCERPT_TURNS = 3
+EXCLUDED_INTENTS = {"GreetingIntent", "ThanksIntent"}
+
+def ticket_entry(ticket, turns, excerpt_turns=EXCERPT_TURNS):
+    """Template data for one ticket: who, what, when and the last few turns.
+
+    `turns` is streamed; only the excerpt is kept.
+    """
+    turns = deque((t for t in turns if t.get("intent_name") not in EXCLUDED_INTENTS), maxlen=excerpt_turns)
+    opened = datetime.utcfromtimestamp(int(ticket.get("opened_at", 0)))
+    return {
+        "session_id": ticket.get("session_id"),
+        "issue_type": ticket.get("issue_type"),
+        "opened_at": opened.strftime("%Y-%m-%d %H:%M UTC"),
+        "repeats": int(ticket.get("updates", 0)),
+        "excerpt": [
+            {"user": t.get("user_text") or "", "bot": t.get("bot_reply") or ""}
+            for t in turns
+        ],
+    }
+
+def similar_entry(ticket, score):
+    """Template data for one similar past ticket (see transcript._related_line)."""
+    return {
+        "issue_type": ticket.get("issue_type"),
+        "session_id": ticket.get("session_id"),
+        "similarity": f"{score:.0%}",
+        "summary": ticket.get("summary") or "",
+        "resolution": ticket.get("resolution") or "no resolution recorded",
+    }
+
+def destination(recipient, entries):
+    return {
+        "Destination": {"ToAddresses": [recipient]},
+        "ReplacementTemplateData": json.dumps({"count": len(entries), "tickets": entries}),
+    }
+
+def send_digests(ses_client, bucket, template_name, source, destinations, budget=None, send_wait=5.0):
+    """Bulk-send the digests; returns {recipient: MessageId} for those SES accepted.
+
+    Each chunk waits up to `send_wait` seconds (and no longer than the
+    invocation's `budget` allows) for send capacity. Stops early when the
+    bucket runs dry or SES refuses the call; digests not sent stay queued
+    for the next run.
+    """
+    delivered = {}
+    chunk_size = max(1, min(MAX_BULK_DESTINATIONS, int(bucket.capacity)))
+    for start in range(0, len(destinations), chunk_size):
+        chunk = destinations[start:start + chunk_size]
+        if not bucket.acquire(len(chunk), timeout=budget.timeout(send_wait) if budget else send_wait):
+            print(f"[WARN] send rate exhausted; {len(destinations) - start} digests deferred")
+            break
+        try:
+            resp = ses_client.send_bulk_templated_email(
+                Source=source,
+                Template=template_name,
+                DefaultTemplateData=json.dumps({"count": 0, "tickets": []}),
+                Destinations=chunk,
+            )
+        except Exception as e:
+            print("SES digest send error:", e)
+            break
+        for dest, status in zip(chunk, resp.get("Status", [])):
+            recipient = dest["Destination"]["ToAddresses"][0]
+            if status.get("Status") == "Success":
+                delivered[recipient] = status.get("MessageId")
+            else:
+                print(f"[WARN] digest to {recipient} not sent: {status.get('Status')} {status.get('Error', '')}")
+    return delivered
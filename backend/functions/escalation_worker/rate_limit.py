@@ -0,0 +1,42 @@
+"""
+Token bucket pacing SES sends to the account's send rate.
+
+Each email (each destination of a bulk send) takes one token; tokens refill
+at `rate` per second up to `capacity`. The bucket is per container, so the
+rate handed to it is the account's MaxSendRate divided by the worker's
+maximum concurrency.
+"""
+import time
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(rate, 1))
+        self.tokens = self.capacity
+        self.clock = clock
+        self.sleep = sleep
+        self._last = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def try_acquire(self, n=1):
+        self._refill()
+        if self.tokens >= n:
+            self.tokens -= n
+            return True
+        return False
+
+    def acquire(self, n=1, timeout=5.0):
+        """Wait up to `timeout` seconds for `n` tokens; False if they did not come."""
+        if n > self.capacity:
+            return False
+        deadline = self.clock() + timeout
+        while not self.try_acquire(n):
+            wait = (n - self.tokens) / self.rate
+            if self.clock() + wait > deadline:
+                return False
+            self.sleep(wait)
+        return True
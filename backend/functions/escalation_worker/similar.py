@@ -0,0 +1,164 @@
+"""
+Similar past escalations, found with MinHash + LSH.
+
+Each escalated transcript (its user messages, as word-bigram shingles) is
+reduced to a 64-value MinHash signature. The signature is split into 32
+bands of 2 (short helpdesk messages only share a few bigrams, so the bands
+are kept narrow); a ticket is filed under one bucket key per band. Looking
+up a new transcript reads the newest BUCKET_QUERY_LIMIT members of its 32
+buckets, keeps the candidates that share the most bands and ranks them by
+estimated Jaccard similarity (the fraction of equal signature values),
+dropping those below MIN_SIMILARITY.
+
+Nothing scans ChatLogs or the ticket history: the index is maintained
+incrementally as tickets are sent. A lookup costs 32 concurrent Queries of
+at most BUCKET_QUERY_LIMIT small items, one BatchGetItem of at most
+MAX_CANDIDATES tickets and tens of microseconds of numpy, however many
+tickets share a common bucket.
+
+DynamoLSHStore keeps tickets in the SimilarTickets table and bucket
+membership in SimilarTicketBuckets, one item per (bucket, ticket): the
+bucket key is the partition key and `member` (the time the ticket was
+indexed, then its id) the sort key, so no item grows with the bucket.
+LocalLSHStore is the in-memory stand-in. IT can record how a ticket was
+resolved by setting `resolution` on its `ticket#<id>` item; it is shown
+alongside the ticket in later escalation emails.
+"""
+import time
+import zlib
+import hashlib
+import numpy as np
+from boto3.dynamodb.conditions import Key
+from assistiq.faq_keywords import normalize
+from assistiq.fanout import gather
+
+NUM_PERM = 64
+BANDS = 32
+ROWS = NUM_PERM // BANDS
+# Smallest prime above 2**32
+_PRIME = np.uint64(4294967311)
+MAX_SHINGLES = 5000
+MAX_CANDIDATES = 50
+# Newest members read per bucket on lookup
+BUCKET_QUERY_LIMIT = 25
+MIN_SIMILARITY = 0.2
+EXCLUDED_INTENTS = {"GreetingIntent", "ThanksIntent"}
+
+_rng = np.random.RandomState(20240611)
+_A = _rng.randint(1, 2 ** 32 - 1, size=NUM_PERM, dtype=np.uint64)
+_B = _rng.randint(0, 2 ** 32 - 1, size=NUM_PERM, dtype=np.uint64)
+
+def shingles(text, k=2):
+    words = normalize(text).split()
+    if len(words) < k:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + k]) for i in range(len(words) - k + 1)}
+
+class ShingleCollector:
+    """Collects shingles from turns as they stream past (bounded)."""
+
+    def __init__(self, max_shingles=MAX_SHINGLES):
+        self.max_shingles = max_shingles
+        self.shingles = set()
+        self.summary = None
+
+    def watch(self, turns):
+        for turn in turns:
+            text = turn.get("user_text") or ""
+            if turn.get("intent_name") not in EXCLUDED_INTENTS and text:
+                if self.summary is None:
+                    self.summary = text[:200]
+                if len(self.shingles) < self.max_shingles:
+                    self.shingles |= shingles(text)
+            yield turn
+
+def signature(shingle_set):
+    """MinHash signature (uint32[NUM_PERM]) of a shingle set; None if empty."""
+    if not shingle_set:
+        return None
+    x = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingle_set), dtype=np.uint64)
+    hashed = (np.outer(_A, x) + _B[:, None]) % _PRIME
+    return (hashed.min(axis=1) & np.uint64(0xFFFFFFFF)).astype(np.uint32)
+
+def band_keys(sig):
+    return [
+        f"band#{i}#{hashlib.blake2b(sig[i * ROWS:(i + 1) * ROWS].tobytes(), digest_size=8).hexdigest()}"
+        for i in range(BANDS)
+    ]
+
+def similarity(sig, other):
+    return float(np.mean(sig == other))
+
+def _rank(sig, candidates, tickets, k, exclude):
+    """Top-k (ticket, score) from band-hit candidates and their stored signatures."""
+    ids = [t for t, _ in sorted(candidates.items(), key=lambda kv: -kv[1]) if t != exclude][:MAX_CANDIDATES]
+    scored = [(tickets[t], similarity(sig, tickets[t]["sig"])) for t in ids if t in tickets]
+    scored = [ts for ts in scored if ts[1] >= MIN_SIMILARITY]
+    scored.sort(key=lambda ts: -ts[1])
+    return scored[:k]
+
+class LocalLSHStore:
+    def __init__(self):
+        self.buckets = {}
+        self.tickets = {}
+
+    def add(self, ticket_id, sig, meta):
+        self.tickets[ticket_id] = {**meta, "ticket_id": ticket_id, "sig": sig}
+        for key in band_keys(sig):
+            self.buckets.setdefault(key, []).append(ticket_id)
+
+    def query(self, sig, k=3, exclude=None):
+        candidates = {}
+        for key in band_keys(sig):
+            for t in self.buckets.get(key, [])[-BUCKET_QUERY_LIMIT:]:
+                candidates[t] = candidates.get(t, 0) + 1
+        return _rank(sig, candidates, self.tickets, k, exclude)
+
+class DynamoLSHStore:
+    def __init__(self, table, bucket_table, dynamodb, clock=time.time):
+        self.table = table
+        self.bucket_table = bucket_table
+        self.dynamodb = dynamodb
+        self.clock = clock
+
+    def add(self, ticket_id, sig, meta):
+        self.table.put_item(Item={**meta, "id": f"ticket#{ticket_id}", "ticket_id": ticket_id, "sig": sig.tobytes()})
+        member = f"{int(self.clock()):010d}#{ticket_id}"
+        # Two BatchWriteItem calls; the writer resends unprocessed items
+        with self.bucket_table.batch_writer() as batch:
+            for key in band_keys(sig):
+                batch.put_item(Item={"id": key, "member": member, "ticket_id": ticket_id})
+
+    def _bucket(self, key):
+        resp = self.bucket_table.query(
+            KeyConditionExpression=Key("id").eq(key),
+            ProjectionExpression="ticket_id",
+            ScanIndexForward=False,
+            Limit=BUCKET_QUERY_LIMIT,
+        )
+        return [item["ticket_id"] for item in resp.get("Items", [])]
+
+    def _batch_get(self, keys):
+        items = []
+        for start in range(0, len(keys), 100):
+            request = {self.table.name: {"Keys": keys[start:start + 100]}}
+            while request:
+                resp = self.dynamodb.batch_get_item(RequestItems=request)
+                items.extend(resp.get("Responses", {}).get(self.table.name, []))
+                request = resp.get("UnprocessedKeys") or {}
+        return items
+
+    def query(self, sig, k=3, exclude=None):
+        candidates = {}
+        for bucket in gather(*[lambda key=key: self._bucket(key) for key in band_keys(sig)]):
+            for t in bucket:
+                candidates[t] = candidates.get(t, 0) + 1
+        if not candidates:
+            return []
+        top = [t for t, _ in sorted(candidates.items(), key=lambda kv: -kv[1]) if t != exclude][:MAX_CANDIDATES]
+        tickets = {}
+        for item in self._batch_get([{"id": f"ticket#{t}"} for t in top]):
+            raw = item["sig"]
+            item["sig"] = np.frombuffer(bytes(getattr(raw, "value", raw)), dtype=np.uint32)
+            tickets[item["ticket_id"]] = item
+        return _rank(sig, {t: candidates[t] for t in top}, tickets, k, exclude)
@@ -0,0 +1,106 @@
+"""
+Streaming renderer for escalation emails.
+
+Turns are consumed once from a generator (the session index, page by page).
+Only the most recent `body_turns` are kept in memory for the email body;
+every turn is written through gzip to a spooled temporary file. When the
+session has more turns than fit in the body, that compressed file is
+attached as the full transcript, so the body size stays flat however long
+the session is. The result is a multipart/mixed message (text and HTML
+alternatives, plus the optional attachment) for SES SendRawEmail.
+
+Similar past tickets are listed under the transcript. They are looked up
+(`related`) only after the turns have streamed past, so the lookup can use
+what was collected from them.
+"""
+import gzip
+import html
+import tempfile
+from collections import deque
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+EXCLUDED_INTENTS = {"GreetingIntent", "ThanksIntent"}
+# Compressed transcripts up to this size stay in memory, larger ones spill to /tmp
+SPOOL_BYTES = 1024 * 1024
+
+def turn_line(turn):
+    return f"[{turn.get('timestamp')}] User: {turn.get('user_text') or ''} | Bot: {turn.get('bot_reply') or ''}"
+
+def _related_line(ticket, score):
+    resolution = ticket.get("resolution") or "no resolution recorded"
+    return (f"{ticket.get('issue_type')} ({score:.0%} similar, session {ticket.get('session_id')}): "
+            f"{ticket.get('summary') or ''} -> {resolution}")
+
+def _text_body(header, recent, total, related):
+    lines = ["⚠️ AssistIQ Escalation Notification", ""]
+    lines += [f"{k}: {v}" for k, v in header.items()]
+    lines += ["", "Conversation Transcript:"]
+    if total > len(recent):
+        lines.append(f"(last {len(recent)} of {total} turns; full transcript attached)")
+    lines += [turn_line(t) for t in recent]
+    if related:
+        lines += ["", "Similar past tickets:"]
+        lines += [f"- {_related_line(t, score)}" for t, score in related]
+    lines += ["", "Please review and take appropriate action."]
+    return "\n".join(lines)
+
+def _html_body(header, recent, total, related):
+    esc = html.escape
+    rows = "".join(
+        f"<tr><td>{esc(str(t.get('timestamp') or ''))}</td>"
+        f"<td>{esc(t.get('user_text') or '')}</td><td>{esc(t.get('bot_reply') or '')}</td></tr>"
+        for t in recent
+    )
+    meta = "".join(f"<li><b>{esc(k)}:</b> {esc(str(v))}</li>" for k, v in header.items())
+    note = f"<p>Last {len(recent)} of {total} turns; the full transcript is attached.</p>" if total > len(recent) else ""
+    similar = ""
+    if related:
+        similar = "<h3>Similar past tickets</h3><ul>" + "".join(
+            f"<li>{esc(_related_line(t, score))}</li>" for t, score in related
+        ) + "</ul>"
+    return (
+        "<h2>AssistIQ Escalation Notification</h2>"
+        f"<ul>{meta}</ul>{note}"
+        "<table border=\"1\" cellpadding=\"4\" cellspacing=\"0\">"
+        f"<tr><th>Time</th><th>User</th><th>Bot</th></tr>{rows}</table>"
+        f"{similar}"
+        "<p>Please review and take appropriate action.</p>"
+    )
+
+def build_message(turns, subject, source, recipient, header, body_turns=20,
+                  attachment_name="transcript.txt.gz", related=None):
+    """Raw MIME bytes of the escalation email for `turns` (any iterable, read once).
+
+    `related`, if given, is called after the turns are consumed and returns
+    (ticket, score) pairs to list as similar past tickets.
+    """
+    recent = deque(maxlen=body_turns)
+    total = 0
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES) as spool:
+        with gzip.GzipFile(fileobj=spool, mode="wb") as gz:
+            for turn in turns:
+                if turn.get("intent_name") in EXCLUDED_INTENTS:
+                    continue
+                total += 1
+                recent.append(turn)
+                gz.write((turn_line(turn) + "\n").encode("utf-8"))
+        similar = related() if related else []
+
+        msg = MIMEMultipart("mixed")
+        msg["Subject"] = subject
+        msg["From"] = source
+        msg["To"] = recipient
+
+        body = MIMEMultipart("alternative")
+        body.attach(MIMEText(_text_body(header, recent, total, similar), "plain", "utf-8"))
+        body.attach(MIMEText(_html_body(header, recent, total, similar), "html", "utf-8"))
+        msg.attach(body)
+
+        if total > len(recent):
+            spool.seek(0)
+            part = MIMEApplication(spool.read(), "gzip")
+            part.add_header("Content-Disposition", "attachment", filename=attachment_name)
+            msg.attach(part)
+    return msg.as_bytes()
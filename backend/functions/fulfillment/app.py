@@ -1,109 +1,308 @@
 import os
 import boto3
 import uuid
-from decimal import Decimal
 from datetime import datetime
-
-# --- DynamoDB + SES Clients ---
-dynamodb = boto3.resource("dynamodb")
+from assistiq import conversation_log
+from assistiq.queues import queue_from_env
+from assistiq.catalog_snapshot import load_snapshot
+from assistiq.faq_keywords import KeywordMatcher
+from assistiq.fanout import DEFAULT_TIMEOUT as FANOUT_TIMEOUT
+from assistiq.budget import TimeBudget, client_config, MAX_ATTEMPTS
+from assistiq.degradation import controller_from_env
+from catalog import IntentCatalog
+from retrieval import BM25Index
+from data_access import InvocationData
+from unit_of_work import UnitOfWork
+from escalation import is_escalation_request, closing_answer, announces_handoff
+from surge import SurgeDetector, DynamoCounterStore, LocalCounterStore
+import session_state as state_codec
+
+# Lex waits less for the code hook than the function timeout allows, so turns
+# are budgeted against the sooner of the two. With less than
+# OPTIONAL_WORK_SECONDS left, optional work (surge counting, FAQ/KB search,
+# waiting on an escalating turn's log write) is skipped or deferred.
+TURN_BUDGET_SECONDS = float(os.environ.get("TURN_BUDGET_SECONDS", "8"))
+OPTIONAL_WORK_SECONDS = float(os.environ.get("OPTIONAL_WORK_SECONDS", "1.5"))
+
+# --- DynamoDB Clients ---
+# AWS calls' attempts are bounded so a call abandoned at its deadline ends within about
+# one turn budget, botocore's retries included
+aws_config = client_config(TURN_BUDGET_SECONDS / (MAX_ATTEMPTS + 1))
+dynamodb = boto3.resource("dynamodb", config=aws_config)
 chatlog_table = dynamodb.Table(os.environ["LOGS_TABLE_NAME"])
 intent_table = dynamodb.Table(os.environ["FAQ_TABLE_NAME"])
-session_table = dynamodb.Table(os.environ["SESSION_TABLE_NAME"])
-ses_client = boto3.client("ses", region_name="us-east-1")
-
-SOURCE_EMAIL = os.environ["SOURCE_EMAIL"]
-SUPPORT_EMAIL = os.environ["SUPPORT_EMAIL"]
+# Dialog state rides in Lex session attributes ("lex"); the session table is
+# only read for sessions that carry no state attribute, or used throughout
+# with SESSION_STATE_BACKEND=dynamodb.
+SESSION_STATE_BACKEND = os.environ.get("SESSION_STATE_BACKEND", "lex")
+session_table = dynamodb.Table(os.environ["SESSION_TABLE_NAME"]) if os.environ.get("SESSION_TABLE_NAME") else None
+# Sessions this container knows have no session-table item (checked against
+# the version Lex carries), so their turns skip the read
+session_cache = state_codec.SessionStateCache(int(os.environ.get("SESSION_CACHE_SIZE", "10000")))
+# Trips on DynamoDB throttling or error spikes seen by any call this container
+# makes; while degraded, turns serve the last known catalog, skip surge
+# counting and defer logs and escalations (see escalate)
+degradation = controller_from_env().attach(dynamodb.meta.client)
+# GSI on ChatLogs: HASH session_id, RANGE turn_ts (see sam-template.yaml)
+SESSION_INDEX_NAME = os.environ.get("LOGS_SESSION_INDEX", "SessionTurnsIndex")
+
+# Escalations are handed to the escalation worker (transcript + SES email)
+# through this queue, so the bot replies without waiting on either.
+escalation_queue = queue_from_env("ESCALATION_QUEUE_URL", config=aws_config)
+# Turn records go to the log writer through this queue when it is configured;
+# otherwise they are part of the turn's transaction
+log_queue = queue_from_env("LOG_QUEUE_URL", config=aws_config) if os.environ.get("LOG_QUEUE_URL") else None
+
+# Outage-prone intents are counted; a surge becomes one incident instead of
+# an escalation per user
+if os.environ.get("INCIDENT_TABLE_NAME"):
+    incident_store = DynamoCounterStore(dynamodb.Table(os.environ["INCIDENT_TABLE_NAME"]), dynamodb)
+else:
+    print("[WARN] INCIDENT_TABLE_NAME not set; surge counters are kept in memory")
+    incident_store = LocalCounterStore()
+surge_detector = SurgeDetector(
+    incident_store,
+    [i.strip() for i in os.environ.get("SURGE_INTENTS", "WifiIssue,VPNIssue,EmailAccess").split(",") if i.strip()],
+    min_count=int(os.environ.get("SURGE_MIN_COUNT", "10")),
+    factor=float(os.environ.get("SURGE_FACTOR", "3.0")),
+)
+
+# Module-level so it stays warm across invocations of this container; the
+# memory-mapped snapshot answers lookups while DynamoDB agrees with it.
+catalog_snapshot = load_snapshot()
+intent_catalog = IntentCatalog(
+    intent_table,
+    ttl_seconds=int(os.environ.get("CATALOG_TTL_SECONDS", "300")),
+    snapshot=catalog_snapshot,
+)
+# Local knowledge base, rebuilt when the catalog version changes: the FAQ
+# keyword automaton (synced incrementally) and the BM25 answer index.
+faq_matcher = KeywordMatcher()
+_kb = {"version": None, "bm25": None}
+KB_MIN_SCORE = float(os.environ.get("KB_MIN_SCORE", "3.0"))
+# Distinct query terms a knowledge-base document must share with the message
+KB_MIN_TERMS = int(os.environ.get("KB_MIN_TERMS", "2"))
+# Asked after a knowledge-base answer; the session then waits for the answer
+# like a fulfilled intent's closing question
+KB_CLOSING = "Did that fix it? If not, I can raise an IT ticket for you."
+KB_EXCLUDED_INTENTS = {"GreetingIntent", "ThanksIntent", "FallbackIntent"}
+
+class Turn:
+    """State of the turn handled by one invocation, built fresh by `lambda_handler`.
+
+    The id comes from the chat proxy (via Lex request attributes) so both
+    sides write the same record. `data` holds the invocation's batched,
+    memoized reads and `uow` its queued writes, committed together when the
+    turn is done; `log_fields` is the turn's record until it is queued or
+    written, and `budget` the invocation's TimeBudget.
+    `carried_state` is the encoded dialog state Lex sent (None if absent),
+    `state_attr` the value to send back (None: unchanged) and `state_in_table`
+    whether this turn's state lives in the session table. `table_item` is
+    whether the session has a table item (None: unknown) and `state_version`
+    the version stamped on the response.
+    """
+
+    def __init__(self, turn_id, session_id, budget, uow):
+        self.id = turn_id
+        self.session_id = session_id
+        self.budget = budget
+        self.uow = uow
+        self.turn_ts = None
+        self.pending_ts = None
+        self.data = None
+        self.log_fields = None
+        self.carried_state = None
+        self.state_attr = None
+        self.state_in_table = False
+        self.loaded_state = None
+        self.table_item = None
+        self.state_version = None
+
+# A deferred escalation waits this long in the queue for its turn's record
+DEFERRED_ESCALATION_DELAY_SECONDS = 30
+# Fallback escalations raised while DynamoDB is degraded are spooled in the
+# queue this long (the SQS maximum), so a throttling burst is not an email storm
+ESCALATION_SPOOL_SECONDS = int(os.environ.get("ESCALATION_SPOOL_SECONDS", "900"))
+
+GREETING_WORDS = {"hi", "hello", "hey"}
+THANKS_WORDS = {"thanks", "thank you", "thx"}
 
 # ================== Utilities ==================
 
 def _safe_str(val):
     return val if val else ""
 
-def log_interaction(user_text, intent_name, confidence, session_id, bot_reply):
-    """Save conversation turns to DynamoDB."""
-    try:
-        chatlog_table.put_item(Item={
-            "id": str(uuid.uuid4()),
-            "session_id": session_id,
-            "timestamp": datetime.utcnow().isoformat(),
-            "user_text": user_text,
-            "intent_name": intent_name,
-            "confidence": Decimal(str(confidence)),
-            "bot_reply": bot_reply
-        })
-    except Exception as e:
-        print("log_interaction error:", e)
+def _budget_allows(turn, work):
+    """True if the turn has time for optional `work`; otherwise it is recorded as degraded."""
+    budget = turn.budget
+    if budget.allows(OPTIONAL_WORK_SECONDS):
+        return True
+    budget.degrade(work)
+    return False
+
+def _dynamodb_allows(turn, work):
+    """False while DynamoDB is degraded; the skipped `work` is recorded."""
+    if not degradation.degraded():
+        return True
+    turn.budget.degrade(work)
+    return False
+
+def log_interaction(turn, user_text, intent_name, confidence, bot_reply):
+    """Hold the current conversation turn's record until the writes are committed."""
+    turn.log_fields = {
+        "session_id": turn.session_id,
+        "user_text": user_text,
+        "bot_reply": bot_reply,
+        "intent_name": intent_name,
+        "confidence": confidence,
+        "now": datetime.utcnow(),
+    }
+
+def commit_writes(turn, sync_log=False):
+    """Flush the invocation's writes: the turn record to the log queue, the rest in one round trip.
+
+    With `sync_log` (or no log queue) the record is written with the other
+    writes instead, for turns whose record must exist once this returns.
+    """
+    fields = turn.log_fields
+    turn.log_fields = None
+    queued = False
+    if fields is not None:
+        if log_queue is not None and not sync_log:
+            record = conversation_log.turn_record(turn.id, **fields)
+            try:
+                log_queue.send(record)
+                turn.pending_ts = record["turn_ts"]
+                queued = True
+            except Exception as e:
+                print("[WARN] log queue send failed, writing the turn directly:", e)
+        if not queued:
+            update, turn.pending_ts = conversation_log.turn_update(turn.id, **fields)
+            # A retried turn id keeps its first turn_ts; report that one
+            turn.uow.update(chatlog_table, update, read_back=("turn_ts", turn.pending_ts))
+
+    ok = turn.uow.commit(timeout=turn.budget.timeout(FANOUT_TIMEOUT))
+    if not queued and fields is not None:
+        turn.pending_ts = turn.uow.stored.get((chatlog_table.name, turn.id), turn.pending_ts)
+    if (ok or queued) and turn.pending_ts:
+        turn.turn_ts = turn.pending_ts
+    turn.pending_ts = None
+    return ok
 
 def get_intent_from_db(intent_name):
-    try:
-        return intent_table.get_item(Key={"id": intent_name}).get("Item")
-    except Exception as e:
-        print("get_intent_from_db error:", e)
+    """Catalog item for an intent, served from the warm in-process cache."""
+    if not intent_name:
         return None
-
-def get_session_state(session_id):
+    return intent_catalog.get(intent_name)
+
+def _sync_knowledge_base():
+    faqs = intent_catalog.faq_items()
+    version = (intent_catalog.version, intent_catalog.snapshot_current())
+    if _kb["version"] != version:
+        faq_matcher.sync(faqs)
+        _kb["bm25"] = BM25Index.from_catalog(faqs, intent_catalog.intent_items(), KB_EXCLUDED_INTENTS)
+        _kb["version"] = version
+
+def match_faq(user_text):
+    """Best FAQ keyword answer for the message, or None."""
+    _sync_knowledge_base()
+    matches = faq_matcher.match(user_text, top_k=1)
+    return matches[0] if matches else None
+
+def search_knowledge_base(user_text, top_k=3):
+    """BM25 top-k (doc, score) pairs above KB_MIN_SCORE from FAQ and intent answers."""
+    _sync_knowledge_base()
+    hits = _kb["bm25"].search(user_text, top_k, min_terms=KB_MIN_TERMS)
+    return [(doc, score) for doc, score in hits if score >= KB_MIN_SCORE]
+
+def _invocation_data(turn):
+    data = turn.data
+    return data if data is not None and data.session_id == turn.session_id else None
+
+def get_session_state(turn):
+    if not turn.state_in_table:
+        encoded = turn.state_attr
+        state = state_codec.decode(turn.carried_state if encoded is None else encoded)
+        if state.get("awaiting_confirmation"):
+            state["confirmation_prompt"] = _safe_str((get_intent_from_db(state["intent_id"]) or {}).get("confirmation"))
+        return state
+    if turn.table_item is False:
+        return {}
+    data = _invocation_data(turn)
+    if data is not None:
+        state = data.session_state()
+        if data.session_loaded():
+            turn.table_item = bool(state)
+        return state
     try:
-        return session_table.get_item(Key={"id": session_id}).get("Item", {})
+        state = session_table.get_item(Key={"id": turn.session_id}).get("Item", {})
     except Exception as e:
         print("get_session_state error:", e)
         return {}
+    turn.table_item = bool(state)
+    return state
+
+def _load_session_state(turn):
+    turn.loaded_state = get_session_state(turn)
+    return turn.loaded_state
+
+def _write_session_item(turn, item=None):
+    """Queue a put (or, without `item`, a delete) of the session's table item."""
+    if item is None:
+        if turn.table_item is False:
+            return
+        turn.uow.delete(session_table, {"id": turn.session_id})
+    else:
+        turn.uow.put(session_table, item)
+    turn.table_item = item is not None
+    turn.state_version = turn.id
 
-def set_session_state(session_id, state):
-    try:
-        session_table.put_item(Item={"id": session_id, **state})
-    except Exception as e:
-        print("set_session_state error:", e)
-
-def clear_session_state(session_id):
-    try:
-        session_table.delete_item(Key={"id": session_id})
-    except Exception as e:
-        print("clear_session_state error:", e)
-
-# ================== Email Helpers ==================
-
-def fetch_conversation(session_id):
-    """Retrieve and sort full conversation history for a session."""
-    try:
-        resp = chatlog_table.scan()
-        convo = [item for item in resp.get("Items", []) if item.get("session_id") == session_id]
-        return sorted(convo, key=lambda x: x.get("timestamp", ""))
-    except Exception as e:
-        print("fetch_conversation error:", e)
-        return []
-
-def send_escalation_email(full_conversation, session_id, issue_type="General Issue"):
-    """Send full transcript to IT via SES."""
-    timestamp = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S UTC")
-    subject = f"AssistIQ Escalation: {issue_type} (Session {session_id})"
-
-    excluded = {"GreetingIntent", "ThanksIntent"}
-    convo_text = "\n".join(
-        f"[{c.get('timestamp')}] User: {_safe_str(c.get('user_text'))} | Bot: {_safe_str(c.get('bot_reply'))}"
-        for c in full_conversation if c.get("intent_name") not in excluded
-    )
-
-    body = (
-        f"⚠️ AssistIQ Escalation Notification\n\n"
-        f"Session ID: {session_id}\n"
-        f"Timestamp: {timestamp}\n"
-        f"Issue Type: {issue_type}\n\n"
-        f"Conversation Transcript:\n{convo_text}\n\n"
-        "Please review and take appropriate action."
-    )
-
+def set_session_state(turn, state):
+    if SESSION_STATE_BACKEND == "dynamodb":
+        _write_session_item(turn, {"id": turn.session_id, **state})
+    else:
+        turn.state_attr = state_codec.encode(state)
+        if turn.state_in_table:
+            # The state moves into the session attributes
+            _write_session_item(turn)
+    data = _invocation_data(turn)
+    if data is not None:
+        data.remember_session_state({"id": turn.session_id, **state})
+
+def clear_session_state(turn):
+    if SESSION_STATE_BACKEND != "dynamodb":
+        turn.state_attr = ""
+    if turn.state_in_table:
+        _write_session_item(turn)
+    data = _invocation_data(turn)
+    if data is not None:
+        data.remember_session_state({})
+
+def _finish_session_state(turn):
+    """Make sure a lex-backend session leaves this turn carrying its state attribute."""
+    if SESSION_STATE_BACKEND == "dynamodb" or turn.state_attr is not None:
+        return
+    if turn.carried_state is None:
+        # First turn on this backend: adopt whatever the table held
+        set_session_state(turn, turn.loaded_state or {})
+
+# ================== Escalation ==================
+
+def enqueue_escalation(turn, issue_type="General Issue", urgent=False, delay_seconds=0):
+    """Hand the escalation to the worker; returns True once it is queued."""
+    message = {
+        "session_id": turn.session_id,
+        "issue_type": issue_type,
+        "turn_id": turn.id,
+        "requested_at": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
+    }
+    if urgent:
+        message["urgent"] = True
     try:
-        resp = ses_client.send_email(
-            Source=SOURCE_EMAIL,
-            Destination={"ToAddresses": [SUPPORT_EMAIL]},
-            Message={
-                "Subject": {"Data": subject},
-                "Body": {"Text": {"Data": body}}
-            }
-        )
-        return resp.get("MessageId") is not None
+        escalation_queue.send(message, delay_seconds=delay_seconds)
+        return True
     except Exception as e:
-        print("SES escalation send error:", e)
+        print("enqueue_escalation error:", e)
         return False
 
 # ================== Lex Response Builders ==================
@@ -128,22 +327,116 @@ def elicit_slot_response(slot_to_elicit, message, intent_name, slots):
 
 # ================== Fulfillment Helper ==================
 
-def fulfill_intent_from_db(user_text, intent_name, session_id):
+def incident_reply(intent_name):
+    topic = intent_name[:-len("Issue")] if intent_name.endswith("Issue") else intent_name
+    return (f"We're seeing a lot of {topic} reports right now and IT is already working on it as an "
+            "incident. I've added your report to it, so there's no need to raise a ticket.")
+
+def check_incident(turn, intent_name, count=False):
+    """Open incident this session belongs to, or None.
+
+    With `count` the request is counted towards surge detection (and may
+    open the incident, which is then escalated once); otherwise the session
+    is only attached to an incident that is already open.
+    """
+    if count and not (_dynamodb_allows(turn, "surge_count") and _budget_allows(turn, "surge_count")):
+        count = False
+    try:
+        if count:
+            incident, opened = surge_detector.observe(
+                intent_name, turn.session_id, timeout=turn.budget.timeout(FANOUT_TIMEOUT))
+            if opened:
+                enqueue_escalation(turn, issue_type=f"Incident:{intent_name}", urgent=True)
+            return incident
+        if intent_name not in surge_detector.intents or not surge_detector.open_incident(intent_name):
+            return None
+        incident_store.attach(intent_name, turn.session_id)
+        return surge_detector.open_incident(intent_name)
+    except Exception as e:
+        print("surge detection error:", e)
+        return None
+
+def escalate(turn, user_text, issue_type, reply, intent_name="FallbackIntent", confidence=1.0):
+    """Log the turn, end the session's dialog and queue the escalation."""
+    if check_incident(turn, issue_type):
+        reply = incident_reply(issue_type)
+        log_interaction(turn, user_text, intent_name, confidence, reply)
+        clear_session_state(turn)
+        return build_response(reply, intent_name)
+
+    announced = reply if announces_handoff(reply) else reply + " Your request has been forwarded to IT."
+    log_interaction(turn, user_text, intent_name, confidence, announced)
+    clear_session_state(turn)
+    delay = 0
+    if not _dynamodb_allows(turn, "escalation_log_write"):
+        # Written behind; a fallback waits out the burst in the queue, since
+        # the bot failing to answer may be the throttling itself
+        commit_writes(turn)
+        delay = ESCALATION_SPOOL_SECONDS if issue_type == "FallbackIntent" else DEFERRED_ESCALATION_DELAY_SECONDS
+    elif _budget_allows(turn, "escalation_log_write"):
+        # The worker reads the transcript, so the turn must be written first
+        commit_writes(turn, sync_log=True)
+    else:
+        # No time to wait on the write: the turn is written behind and the
+        # escalation waits in the queue for it
+        commit_writes(turn)
+        delay = DEFERRED_ESCALATION_DELAY_SECONDS
+
+    if enqueue_escalation(turn, issue_type=issue_type, delay_seconds=delay):
+        return build_response(announced, intent_name)
+    # The record is merged again with the reply the user actually gets
+    reply += " (Escalation failed, please contact IT directly.)"
+    log_interaction(turn, user_text, intent_name, confidence, reply)
+    return build_response(reply, intent_name)
+
+def deflect(turn, user_text, answer, source, confidence, closing_intent="FallbackIntent"):
+    """Answer a fallback turn from the knowledge base and offer escalation.
+
+    A negative answer to KB_CLOSING escalates as `closing_intent`.
+    """
+    reply = f"{answer}\n\n{KB_CLOSING}"
+    log_interaction(turn, user_text, source, round(confidence, 4), reply)
+    set_session_state(turn, {"awaiting_closing": True, "intent_id": closing_intent})
+    return build_response(reply, "FallbackIntent")
+
+def answer_from_knowledge_base(turn, user_text):
+    """Deflect a fallback turn with an FAQ keyword or BM25 answer; None if nothing clears the bar."""
+    # Keyword and BM25 search may rebuild the knowledge base (a table scan)
+    if not _budget_allows(turn, "knowledge_base"):
+        return None
+    # --- Known FAQ keywords ---
+    faq = match_faq(user_text)
+    if faq and faq.get("answer"):
+        return deflect(turn, user_text, faq["answer"], f"faq:{faq['id']}", faq["coverage"])
+
+    # --- Knowledge base retrieval ---
+    hits = search_knowledge_base(user_text, top_k=1)
+    if hits:
+        doc, score = hits[0]
+        # An intent hit escalates as that intent if its answer did not help
+        closing_intent = "FallbackIntent" if doc["id"].startswith("faq:") else doc["id"]
+        return deflect(turn, user_text, doc["answer"], doc["id"], score, closing_intent)
+    return None
+
+def fulfill_intent_from_db(turn, user_text, intent_name):
     intent_item = get_intent_from_db(intent_name)
+    if intent_item and intent_item.get("escalate_on_confirm"):
+        # Confirming this intent is itself the request to IT
+        return escalate(turn, user_text, intent_name,
+                        _safe_str(intent_item.get("fulfillment")).strip(), intent_name)
+
     if intent_item:
         reply = f"{_safe_str(intent_item.get('fulfillment'))}\n\n{_safe_str(intent_item.get('closing_response'))}".strip()
     else:
         reply = "I have processed your request."
 
-    # ✅ Log first before escalation
-    log_interaction(user_text, intent_name, 1.0, session_id, reply)
-
-    excluded_from_escalation = {"GreetingIntent", "ThanksIntent"}
-    if intent_name not in excluded_from_escalation:
-        convo = fetch_conversation(session_id)
-        send_escalation_email(convo, session_id, issue_type=intent_name)
+    log_interaction(turn, user_text, intent_name, 1.0, reply)
+    if intent_item and intent_item.get("closing_response") and intent_name not in {"GreetingIntent", "ThanksIntent"}:
+        # Wait for the answer to the closing question before escalating
+        set_session_state(turn, {"awaiting_closing": True, "intent_id": intent_name})
+    else:
+        clear_session_state(turn)
 
-    clear_session_state(session_id)
     return build_response(reply, intent_name)
 
 # ================== Lambda Handler ==================
@@ -151,27 +444,96 @@ def fulfill_intent_from_db(user_text, intent_name, session_id):
 def lambda_handler(event, context):
     print("Fulfillment Lambda event keys:", list(event.keys()))
 
+    request_attrs = event.get("requestAttributes") or {}
+    turn = Turn(
+        request_attrs.get(conversation_log.TURN_ID_ATTR) or conversation_log.new_turn_id(),
+        event.get("sessionId") or str(uuid.uuid4()),
+        TimeBudget(context, limit_seconds=TURN_BUDGET_SECONDS),
+        UnitOfWork(dynamodb.meta.client),
+    )
+    session_id = turn.session_id
+    intent_catalog.offline = not _dynamodb_allows(turn, "catalog_reads")
+    intent_catalog.budget = turn.budget
+    carried_attrs = (event.get("sessionState") or {}).get("sessionAttributes")
+    turn.carried_state = carried = state_codec.carried_state(carried_attrs)
+    turn.state_version = version = state_codec.carried_version(carried_attrs)
+    # Definite miss: a session the proxy just created, one it minted (with the
+    # lex backend), or one this container saw without an item at the version
+    # Lex carried
+    known_empty = (request_attrs.get(conversation_log.NEW_SESSION_ATTR) == "1"
+                   or (SESSION_STATE_BACKEND == "lex" and conversation_log.minted_session(session_id))
+                   or session_cache.known_empty(session_id, version))
+    turn.table_item = False if known_empty else None
+    turn.state_in_table = session_table is not None and (
+        SESSION_STATE_BACKEND == "dynamodb" or (carried is None and not known_empty)
+    )
+
+    response = handle_turn(turn, event)
+    _finish_session_state(turn)
+    if not commit_writes(turn):
+        session_cache.forget(session_id)
+    elif session_table is not None and turn.table_item is not None:
+        turn.state_version = turn.state_version or "0"
+        session_cache.remember(session_id, turn.state_version, turn.table_item)
+
+    # Carry the Lex session attributes forward and tell the proxy the turn is logged
+    session_attrs = dict((event.get("sessionState") or {}).get("sessionAttributes") or {})
+    session_attrs.update(response["sessionState"].get("sessionAttributes") or {})
+    if turn.turn_ts:
+        session_attrs.update(conversation_log.logged_turn_attributes(turn.id, turn.turn_ts))
+    if turn.state_attr is not None:
+        session_attrs[state_codec.STATE_ATTR] = turn.state_attr
+    if turn.state_version is not None:
+        session_attrs[state_codec.VERSION_ATTR] = turn.state_version
+    response["sessionState"]["sessionAttributes"] = session_attrs
+    turn.budget.report(turn_id=turn.id, session_id=session_id)
+    return response
+
+def handle_turn(turn, event):
     user_text = (event.get("inputTranscript") or event.get("inputText") or "").strip()
-    session_id = event.get("sessionId") or str(uuid.uuid4())
+    session_id = turn.session_id
     print("Resolved session_id:", session_id, "user_text:", user_text)
 
-    session_state = get_session_state(session_id)
-
     intent_state = event.get("sessionState", {}) or {}
     intent = intent_state.get("intent", {}) or {}
     intent_name = intent.get("name")
     slots = intent.get("slots", {}) or {}
 
+    # One BatchGetItem for every intent this turn may need (and the session
+    # item, when the state is not carried in the session attributes)
+    data = InvocationData(dynamodb, session_table, intent_catalog, session_id)
+    turn.data = data
+    candidates = [intent_name, "FallbackIntent"]
+    if user_text.lower() in GREETING_WORDS:
+        candidates.append("GreetingIntent")
+    if user_text.lower() in THANKS_WORDS:
+        candidates.append("ThanksIntent")
+    candidates.append(state_codec.decode(turn.carried_state).get("intent_id"))
+    if intent_catalog.offline:
+        # Served from the last known catalog instead
+        candidates = []
+    reads = [lambda: data.prefetch(candidates, include_session=turn.state_in_table and turn.table_item is None)]
+    if intent_name in surge_detector.intents:
+        # Warm the incident cache alongside the batch read
+        reads.append(lambda: surge_detector.open_incident(intent_name))
+    try:
+        turn.budget.run(*reads, cap=FANOUT_TIMEOUT)
+    except Exception as e:
+        # Anything not loaded is read lazily
+        print("prefetch error:", e)
+
+    session_state = _load_session_state(turn)
+
     # --- Handle confirmation state ---
     confirmation_state = intent.get("confirmationState")
     if confirmation_state == "Denied":
         reply = "Okay — I have cancelled that request. Let me know if you need anything else."
-        log_interaction(user_text, intent_name or "UnknownIntent", 1.0, session_id, reply)
-        clear_session_state(session_id)
+        log_interaction(turn, user_text, intent_name or "UnknownIntent", 1.0, reply)
+        clear_session_state(turn)
         return build_response(reply, intent_name or "FallbackIntent")
 
     if confirmation_state == "Confirmed":
-        return fulfill_intent_from_db(user_text, intent_name, session_id)
+        return fulfill_intent_from_db(turn, user_text, intent_name)
 
     # --- Handle confirm slot ---
     confirm_slot = slots.get("confirm")
@@ -181,27 +543,42 @@ def lambda_handler(event, context):
         negatives = {"no", "nah", "nope", "cancel", "stop"}
 
         if interpreted in positives:
-            return fulfill_intent_from_db(user_text, intent_name, session_id)
+            return fulfill_intent_from_db(turn, user_text, intent_name)
         if interpreted in negatives:
             reply = "Okay — I have cancelled that request. Let me know if you need anything else."
-            log_interaction(user_text, intent_name or "UnknownIntent", 1.0, session_id, reply)
-            clear_session_state(session_id)
+            log_interaction(turn, user_text, intent_name or "UnknownIntent", 1.0, reply)
+            clear_session_state(turn)
             return build_response(reply, intent_name or "FallbackIntent")
 
         return elicit_slot_response("confirm", "Please reply with yes or no.", intent_name, slots)
 
+    # --- Handle the answer to a fulfilled intent's closing question ---
+    if session_state.get("awaiting_closing") and session_state.get("intent_id"):
+        answer = closing_answer(user_text)
+        closed_intent = session_state["intent_id"]
+        if answer == "escalate":
+            return escalate(turn, user_text, closed_intent,
+                            "Sorry that didn't solve it.", closed_intent)
+        if answer == "resolved":
+            reply = "Great, glad that sorted it. Let me know if you need anything else."
+            log_interaction(turn, user_text, closed_intent, 1.0, reply)
+            clear_session_state(turn)
+            return build_response(reply, closed_intent)
+        # Anything else is a new request
+        clear_session_state(turn)
+
     # --- Greeting intent ---
-    if user_text.lower() in {"hi", "hello", "hey"}:
+    if user_text.lower() in GREETING_WORDS:
         intent_item = get_intent_from_db("GreetingIntent")
         reply = _safe_str(intent_item.get("fulfillment")) or _safe_str(intent_item.get("initial_response")) or "Hello!"
-        log_interaction(user_text, "GreetingIntent", 1.0, session_id, reply)
+        log_interaction(turn, user_text, "GreetingIntent", 1.0, reply)
         return build_response(reply, "GreetingIntent")
 
     # --- Thanks intent ---
-    if user_text.lower() in {"thanks", "thank you", "thx"}:
+    if user_text.lower() in THANKS_WORDS:
         intent_item = get_intent_from_db("ThanksIntent")
         reply = _safe_str(intent_item.get("fulfillment")) or _safe_str(intent_item.get("initial_response")) or "You're welcome!"
-        log_interaction(user_text, "ThanksIntent", 1.0, session_id, reply)
+        log_interaction(turn, user_text, "ThanksIntent", 1.0, reply)
         return build_response(reply, "ThanksIntent")
 
     # --- Handle awaiting confirmation session state ---
@@ -210,45 +587,49 @@ def lambda_handler(event, context):
         negatives = {"no", "nah", "nope", "cancel", "stop"}
 
         if user_text.lower() in positives:
-            return fulfill_intent_from_db(user_text, session_state["intent_id"], session_id)
+            return fulfill_intent_from_db(turn, user_text, session_state["intent_id"])
         if user_text.lower() in negatives:
             reply = "Okay — I have cancelled that request. Let me know if you need anything else."
-            log_interaction(user_text, session_state.get("intent_id"), 1.0, session_id, reply)
-            clear_session_state(session_id)
+            log_interaction(turn, user_text, session_state.get("intent_id"), 1.0, reply)
+            clear_session_state(turn)
             return build_response(reply, session_state.get("intent_id"))
 
         return build_response(session_state.get("confirmation_prompt") or "Please reply with yes or no.", "FallbackIntent")
 
-    # --- Handle known intents ---
-    if intent_name:
-        intent_item = get_intent_from_db(intent_name)
-        if intent_item:
-            if intent_item.get("confirmation"):
-                set_session_state(session_id, {
-                    "awaiting_confirmation": True,
-                    "intent_id": intent_item["id"],
-                    "confirmation_prompt": intent_item["confirmation"]
-                })
-                reply = _safe_str(intent_item["confirmation"])
-                log_interaction(user_text, intent_item["id"], 1.0, session_id, reply)
-                return build_response(reply, intent_item["id"])
-
-            return fulfill_intent_from_db(user_text, intent_item["id"], session_id)
+    # --- Explicit request for a human ---
+    if is_escalation_request(user_text):
+        return escalate(turn, user_text, intent_name or "UserRequest",
+                        "Okay, I'll get a person from IT to help.", intent_name or "FallbackIntent")
+
+    # --- Unrecognized input (Lex sends it as FallbackIntent): deflect before escalating ---
+    intent_item = get_intent_from_db(intent_name)
+    if intent_name == "FallbackIntent" or not intent_item:
+        deflected = answer_from_knowledge_base(turn, user_text)
+        if deflected:
+            return deflected
+
+    # --- Handle known intents (FallbackIntent asks to forward the message to IT) ---
+    if intent_item:
+        if check_incident(turn, intent_item["id"], count=True):
+            reply = incident_reply(intent_item["id"])
+            log_interaction(turn, user_text, intent_item["id"], 1.0, reply)
+            clear_session_state(turn)
+            return build_response(reply, intent_item["id"])
+
+        if intent_item.get("confirmation"):
+            set_session_state(turn, {
+                "awaiting_confirmation": True,
+                "intent_id": intent_item["id"],
+                "confirmation_prompt": intent_item["confirmation"]
+            })
+            reply = _safe_str(intent_item["confirmation"])
+            log_interaction(turn, user_text, intent_item["id"], 1.0, reply)
+            return build_response(reply, intent_item["id"])
+
+        return fulfill_intent_from_db(turn, user_text, intent_item["id"])
 
     # --- Fallback escalation ---
     fallback = get_intent_from_db("FallbackIntent")
     fallback_msg = _safe_str(fallback.get("initial_response")) if fallback else "I couldn’t understand that. Escalating to IT."
 
-    # ✅ Log first, then escalate
-    log_interaction(user_text, "FallbackIntent", 0.0, session_id, fallback_msg)
-
-    convo = fetch_conversation(session_id)
-    escalated = send_escalation_email(convo, session_id, issue_type="FallbackIntent")
-
-    if escalated:
-        fallback_msg += " Your request has been forwarded to IT."
-    else:
-        fallback_msg += " (Escalation failed, please contact IT directly.)"
-
-    clear_session_state(session_id)
-    return build_response(fallback_msg, "FallbackIntent")
+    return escalate(turn, user_text, "FallbackIntent", fallback_msg, confidence=0.0)
@@ -0,0 +1,154 @@
+"""
+Warm in-process cache of the intent catalog (the FAQ/intent table).
+
+The cache lives at module level, so it survives across warm invocations of
+the container. Entries are kept until the TTL expires; the catalog is then
+revalidated with a single GetItem of the version item, and the entries are
+only dropped when that version has changed (the seed scripts publish it).
+Lookups for ids that do not exist are cached too.
+
+When the compiled snapshot from the SharedLayer is available it is trusted
+from cold start, and stays authoritative for as long as the version item
+matches it (or is absent); DynamoDB is then only read for the periodic
+version check, and serves items only once its version differs.
+
+While `offline` is set (DynamoDB degraded), the catalog does not read the
+table at all: it serves the last known entries and listings, falling back
+to the snapshot regardless of version. A failed read also falls back to
+the last known item rather than reporting the intent missing.
+
+`budget` is the invocation's TimeBudget: a listing scan only starts a page
+while the budget has time for one, and falls back like a failed read.
+"""
+import time
+from boto3.dynamodb.conditions import Attr
+
+VERSION_ITEM_ID = "__catalog_version__"
+
+# Back-off before retrying a failed version check, serving cached entries meanwhile
+_RETRY_SECONDS = 5
+# Budget a listing scan needs left to read another page
+_SCAN_PAGE_SECONDS = 1.0
+
+_MISSING = object()
+
+class IntentCatalog:
+    def __init__(self, table, ttl_seconds=300, snapshot=None, clock=time.monotonic):
+        self.table = table
+        self.ttl_seconds = ttl_seconds
+        self.snapshot = snapshot
+        self.clock = clock
+        self.version = None
+        self.expires_at = 0.0
+        self._entries = {}
+        self._listings = {}
+        self.offline = False
+        self.budget = None
+        if snapshot is not None:
+            self.version = snapshot.version
+            self.expires_at = clock() + ttl_seconds
+
+    def snapshot_current(self):
+        return self.snapshot is not None and self.version in (None, self.snapshot.version)
+
+    def stale(self):
+        """True when the next lookup would first check the version item."""
+        return not self.offline and self.clock() >= self.expires_at
+
+    def cached(self, intent_id):
+        """(True, item_or_None) if resolvable without DynamoDB, else (False, None)."""
+        if self.snapshot_current():
+            return True, self.snapshot.intent(intent_id)
+        item = self._entries.get(intent_id)
+        if item is None:
+            return False, None
+        return True, None if item is _MISSING else item
+
+    def store(self, intent_id, item):
+        """Record an item (or its absence) fetched elsewhere, e.g. in a batch read."""
+        if not self.snapshot_current():
+            self._entries[intent_id] = item or _MISSING
+
+    def get(self, intent_id):
+        """Catalog item for `intent_id`, or None if it does not exist."""
+        self._revalidate()
+        found, item = self.cached(intent_id)
+        if found:
+            return item
+        if self.offline:
+            return self.last_known(intent_id)
+        try:
+            item = self.table.get_item(Key={"id": intent_id}).get("Item")
+        except Exception as e:
+            # Errors are not cached as negative lookups
+            print("IntentCatalog get_item error:", e)
+            return self.last_known(intent_id)
+        self.store(intent_id, item)
+        return item
+
+    def last_known(self, intent_id):
+        """Cached item for `intent_id` from any version, else the snapshot's, else None."""
+        item = self._entries.get(intent_id)
+        if item is not None and item is not _MISSING:
+            return item
+        return self.snapshot.intent(intent_id) if self.snapshot is not None else None
+
+    def faq_items(self):
+        """FAQ items (those with `q_keywords`) for the current catalog version."""
+        return self._listing("faqs", Attr("q_keywords").exists(), lambda snap: snap.faqs())
+
+    def intent_items(self):
+        """All intent items for the current catalog version."""
+        return self._listing("intents", Attr("type").eq("intent"), lambda snap: snap.intents())
+
+    def _listing(self, name, filter_expression, from_snapshot):
+        self._revalidate()
+        if self.snapshot_current():
+            return from_snapshot(self.snapshot)
+        if name not in self._listings:
+            if self.offline:
+                return self._last_listing(from_snapshot)
+            # Only after a version change; the FAQ table is small
+            kwargs = {"FilterExpression": filter_expression}
+            items = []
+            try:
+                while True:
+                    if self.budget is not None and not self.budget.allows(_SCAN_PAGE_SECONDS):
+                        raise TimeoutError("time budget exhausted")
+                    resp = self.table.scan(**kwargs)
+                    items.extend(resp.get("Items", []))
+                    if "LastEvaluatedKey" not in resp:
+                        break
+                    kwargs["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+            except Exception as e:
+                print(f"IntentCatalog {name} scan error:", e)
+                return self._last_listing(from_snapshot)
+            self._listings[name] = items
+        return self._listings[name]
+
+    def _last_listing(self, from_snapshot):
+        return from_snapshot(self.snapshot) if self.snapshot is not None else []
+
+    def invalidate(self):
+        self._entries.clear()
+        self._listings.clear()
+        self.expires_at = 0.0
+
+    def apply_version(self, version):
+        """Accept the version item's current value (fetched here or in a batch read)."""
+        if version != self.version:
+            self._entries.clear()
+            self._listings.clear()
+            self.version = version
+        self.expires_at = self.clock() + self.ttl_seconds
+
+    def _revalidate(self):
+        if not self.stale():
+            return
+        try:
+            resp = self.table.get_item(Key={"id": VERSION_ITEM_ID}, ProjectionExpression="version")
+        except Exception as e:
+            print("IntentCatalog version check error:", e)
+            self.expires_at = self.clock() + _RETRY_SECONDS
+            return
+        self.apply_version(resp.get("Item", {}).get("version"))
@@ -0,0 +1,98 @@
+"""
+Per-invocation read layer for the fulfillment Lambda.
+
+Everything a turn needs up front (the session item when the dialog state is
+kept in the session table, the intents it may look up, and the catalog
+version item when the cache is due for revalidation) is fetched in a single
+BatchGetItem, projected to the attributes the handler
+actually reads. Results are memoized for the rest of the invocation and the
+intents are handed to the warm IntentCatalog, so later lookups are local.
+"""
+from catalog import VERSION_ITEM_ID
+
+INTENT_ATTRIBUTES = ("id", "confirmation", "fulfillment", "closing_response", "initial_response", "escalate_on_confirm")
+SESSION_ATTRIBUTES = ("id", "awaiting_confirmation", "awaiting_closing", "intent_id", "confirmation_prompt")
+
+_MAX_BATCH_ATTEMPTS = 3
+
+def _projection(attributes):
+    names = {f"#p{i}": a for i, a in enumerate(attributes)}
+    return {"ProjectionExpression": ", ".join(names), "ExpressionAttributeNames": names}
+
+class InvocationData:
+    def __init__(self, dynamodb, session_table, catalog, session_id):
+        self.dynamodb = dynamodb
+        self.session_table = session_table
+        self.catalog = catalog
+        self.session_id = session_id
+        self._session = None
+
+    def prefetch(self, intent_names, include_session=True):
+        """Load the session item and any uncached intents in one round trip."""
+        intent_names = [n for n in dict.fromkeys(intent_names) if n]
+        catalog_stale = self.catalog.stale()
+        if catalog_stale:
+            wanted = intent_names
+        else:
+            wanted = [n for n in intent_names if not self.catalog.cached(n)[0]]
+
+        request = {}
+        if include_session:
+            request[self.session_table.name] = {"Keys": [{"id": self.session_id}], **_projection(SESSION_ATTRIBUTES)}
+        intent_keys = [{"id": n} for n in wanted]
+        if catalog_stale:
+            intent_keys.append({"id": VERSION_ITEM_ID})
+        if intent_keys:
+            request[self.catalog.table.name] = {
+                "Keys": intent_keys,
+                **_projection(INTENT_ATTRIBUTES + ("version",)),
+            }
+
+        if not request:
+            return
+        try:
+            responses = self._batch_get(request)
+        except Exception as e:
+            # Fall back to the individual reads done lazily by the accessors
+            print("InvocationData prefetch error:", e)
+            return
+
+        if include_session:
+            session_items = responses.get(self.session_table.name, [])
+            self._session = session_items[0] if session_items else {}
+
+        by_id = {it["id"]: it for it in responses.get(self.catalog.table.name, [])}
+        if catalog_stale:
+            self.catalog.apply_version(by_id.pop(VERSION_ITEM_ID, {}).get("version"))
+        for name in wanted:
+            self.catalog.store(name, by_id.get(name))
+
+    def _batch_get(self, request):
+        responses = {}
+        for _ in range(_MAX_BATCH_ATTEMPTS):
+            resp = self.dynamodb.batch_get_item(RequestItems=request)
+            for table, items in resp.get("Responses", {}).items():
+                responses.setdefault(table, []).extend(items)
+            request = resp.get("UnprocessedKeys") or {}
+            if not request:
+                return responses
+        raise RuntimeError(f"unprocessed keys after {_MAX_BATCH_ATTEMPTS} attempts: {list(request)}")
+
+    def session_state(self):
+        if self._session is None:
+            try:
+                self._session = self.session_table.get_item(
+                    Key={"id": self.session_id}, **_projection(SESSION_ATTRIBUTES)
+                ).get("Item", {})
+            except Exception as e:
+                print("get_session_state error:", e)
+                return {}
+        return self._session
+
+    def session_loaded(self):
+        """True once the session item (or its absence) has actually been read."""
+        return self._session is not None
+
+    def remember_session_state(self, state):
+        """Keep the memo in line with writes made during the invocation."""
+        self._session = state
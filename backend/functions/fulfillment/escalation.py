@@ -0,0 +1,58 @@
+"""
+When a conversation escalates to IT.
+
+A fulfilled intent no longer escalates by itself: its closing question is
+asked and the session waits for the answer. Every closing question in the
+catalog is phrased "Did that fix it? If not, ...", so "yes" always means
+resolved and "no" always means escalate. The session moves through
+
+    awaiting_confirmation -> awaiting_closing -> resolved | escalated
+
+and escalates only when the user asks for it explicitly, on fallback, or
+when the answer to the closing question is negative. Intents whose
+confirmation is itself a request to IT (`escalate_on_confirm`) escalate as
+soon as they are confirmed; their fulfillment text already tells the user
+so, and no hand-off sentence is appended to it.
+"""
+from assistiq.faq_keywords import normalize
+
+ESCALATION_PHRASES = (
+    "escalate", "raise a ticket", "open a ticket", "create a ticket", "create ticket",
+    "open ticket", "raise ticket", "talk to a human", "speak to a human", "talk to someone",
+    "real person", "human agent", "contact it", "technician",
+)
+# Replies that already tell the user the request went to IT
+HANDOFF_PHRASES = ("forwarded", "sent details to it", "passed this to it", "escalated")
+# Answers to the closing question that mean the problem is not solved
+NEGATIVE_CLOSING = {
+    "no", "nope", "nah", "not really", "didnt work", "did not work", "didnt help",
+    "did not help", "not fixed", "still broken", "still not working", "still locked",
+    "still fails", "still failing", "it still fails", "not working", "same issue",
+}
+POSITIVE_CLOSING = {
+    "yes", "yeah", "yep", "yes thanks", "it worked", "that worked", "worked", "fixed",
+    "all good", "solved", "resolved", "that helped", "helpful", "thanks", "thank you", "thx",
+}
+
+def is_escalation_request(text):
+    """True if the message explicitly asks for a human / IT ticket."""
+    norm = f" {normalize(text)} "
+    return any(f" {p} " in norm for p in ESCALATION_PHRASES)
+
+def announces_handoff(reply):
+    """True if the reply already says the request was handed to IT."""
+    norm = f" {normalize(reply)} "
+    return any(f" {p} " in norm for p in HANDOFF_PHRASES)
+
+def closing_answer(text):
+    """Classify a reply to the closing question: "escalate", "resolved" or None.
+
+    None means the user moved on to something else; the turn is handled as
+    a new request.
+    """
+    norm = normalize(text)
+    if is_escalation_request(text) or norm in NEGATIVE_CLOSING or norm.startswith("still "):
+        return "escalate"
+    if norm in POSITIVE_CLOSING:
+        return "resolved"
+    return None
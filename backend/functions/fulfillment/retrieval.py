@@ -0,0 +1,84 @@
+"""
+BM25 retrieval over the knowledge base answers (FAQ answers and intent
+fulfillment texts), used on the fallback path before escalating to IT.
+
+The index is a sparse term-document matrix stored column-wise (per term:
+a slice of document ids and precomputed BM25 weights), so scoring a query is
+a gather of its terms' slices plus one `np.bincount`; no per-document loop.
+"""
+import numpy as np
+from assistiq.faq_keywords import normalize
+
+_STOPWORDS = {
+    "a", "am", "an", "and", "are", "be", "can", "do", "for", "get", "have", "help",
+    "how", "i", "if", "im", "in", "is", "it", "me", "my", "need", "new", "of", "on",
+    "or", "please", "that", "the", "this", "to", "want", "with", "you",
+}
+
+def tokenize(text):
+    return [t for t in normalize(text).split() if t not in _STOPWORDS]
+
+class BM25Index:
+    def __init__(self, docs, k1=1.2, b=0.75):
+        """`docs` is a list of dicts with `id`, `text` (indexed) and `answer` (returned)."""
+        self.docs = list(docs)
+        tokenized = [tokenize(d["text"]) for d in self.docs]
+        n_docs = len(tokenized)
+
+        vocab = {}
+        rows, cols = [], []
+        for doc_i, toks in enumerate(tokenized):
+            for tok in toks:
+                rows.append(vocab.setdefault(tok, len(vocab)))
+                cols.append(doc_i)
+        self.vocab = vocab
+        self.n_docs = n_docs
+
+        # Term frequencies as (term, doc) pairs, sorted by term -> CSC-style postings
+        pairs = np.array([rows, cols], dtype=np.int64).reshape(2, -1)
+        keys, tf = np.unique(pairs[0] * max(n_docs, 1) + pairs[1], return_counts=True)
+        term_ids = keys // max(n_docs, 1)
+        self.doc_ids = (keys % max(n_docs, 1)).astype(np.int32)
+        self.indptr = np.searchsorted(term_ids, np.arange(len(vocab) + 1)).astype(np.int64)
+
+        doc_len = np.array([len(t) for t in tokenized], dtype=np.float32)
+        avgdl = float(doc_len.mean()) if n_docs else 0.0
+        df = np.diff(self.indptr).astype(np.float32)
+        idf = np.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+        tf = tf.astype(np.float32)
+        norm = k1 * (1.0 - b + b * doc_len[self.doc_ids] / max(avgdl, 1e-9))
+        self.weights = (np.repeat(idf, np.diff(self.indptr)) * tf * (k1 + 1.0) / (tf + norm)).astype(np.float32)
+
+    @classmethod
+    def from_catalog(cls, faqs, intents, exclude_intents=()):
+        docs = []
+        for faq in faqs:
+            if faq.get("answer"):
+                text = " ".join(list(faq.get("q_keywords") or []) + [faq["answer"]])
+                docs.append({"id": f"faq:{faq['id']}", "text": text, "answer": faq["answer"]})
+        for intent in intents:
+            # Intents confirmed as a request to IT have no self-help answer
+            if intent.get("escalate_on_confirm") or intent.get("id") in exclude_intents:
+                continue
+            if intent.get("fulfillment"):
+                text = " ".join(list(intent.get("utterances") or []) + [intent["fulfillment"]])
+                docs.append({"id": intent["id"], "text": text, "answer": intent["fulfillment"]})
+        return cls(docs)
+
+    def search(self, text, top_k=3, min_terms=1):
+        """Top-k documents as (doc, score) pairs, best first; empty if nothing matched.
+
+        Documents sharing fewer than `min_terms` distinct terms with the query
+        are left out, so one generic shared word is not a match.
+        """
+        terms = {self.vocab[t] for t in tokenize(text) if t in self.vocab}
+        if len(terms) < max(min_terms, 1) or not self.n_docs:
+            return []
+        idx = np.concatenate([np.arange(self.indptr[t], self.indptr[t + 1]) for t in terms])
+        scores = np.bincount(self.doc_ids[idx], weights=self.weights[idx], minlength=self.n_docs)
+        matched = np.bincount(self.doc_ids[idx], minlength=self.n_docs)
+        scores[matched < min_terms] = 0.0
+        k = min(top_k, self.n_docs)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.docs[i], float(scores[i])) for i in top if scores[i] > 0]
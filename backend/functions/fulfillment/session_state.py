@@ -0,0 +1,78 @@
+"""
+Dialog state carried in Lex V2 session attributes.
+
+The handler's state is tiny (which intent, and whether we are waiting for a
+confirmation or for the answer to the closing question), so instead of a
+DynamoDB item per session it rides along in `sessionState.sessionAttributes`
+under STATE_ATTR, which Lex hands back on the next turn:
+
+    "c:PasswordReset"   awaiting confirmation of PasswordReset
+    "k:WifiIssue"       awaiting the answer to WifiIssue's closing question
+    ""                  no pending state
+
+The confirmation prompt is not stored; it is the intent's `confirmation`.
+A session whose attributes have no STATE_ATTR at all (it started before
+this backend, or Lex dropped its attributes) falls back to the session
+table when one is configured.
+
+Reads of the session table are skipped for sessions known to have no item
+there. SessionStateCache remembers, per container, whether a session's item
+exists as of a version; the version is the id of the turn that last wrote
+the item, stamped into VERSION_ATTR on every response. Lex hands the latest
+stamp to whichever container serves the next turn, so an entry whose version
+matches the event's is current without reading anything.
+"""
+from collections import OrderedDict
+from assistiq.conversation_log import DIALOG_STATE_ATTR
+
+STATE_ATTR = DIALOG_STATE_ATTR
+VERSION_ATTR = "aiq_sv"
+
+_STAGES = {"c": "awaiting_confirmation", "k": "awaiting_closing"}
+_CODES = {flag: code for code, flag in _STAGES.items()}
+
+def encode(state):
+    """Attribute value for a state dict ({} or None clears it)."""
+    for flag, code in _CODES.items():
+        if state and state.get(flag) and state.get("intent_id"):
+            return f"{code}:{state['intent_id']}"
+    return ""
+
+def decode(value):
+    """State dict for an attribute value; {} for no state or a value we cannot read."""
+    code, _, intent_id = (value or "").partition(":")
+    if code not in _STAGES or not intent_id:
+        return {}
+    return {_STAGES[code]: True, "intent_id": intent_id}
+
+def carried_state(session_attributes):
+    """The encoded state from the event's session attributes, or None if absent."""
+    return (session_attributes or {}).get(STATE_ATTR)
+
+def carried_version(session_attributes):
+    """Version of the session's table item from the event, or None if absent."""
+    return (session_attributes or {}).get(VERSION_ATTR)
+
+class SessionStateCache:
+    """Per-container LRU of {session_id: (version, has_item)}."""
+
+    def __init__(self, capacity=10000):
+        self.capacity = capacity
+        self._entries = OrderedDict()
+
+    def known_empty(self, session_id, version):
+        """True only if the session had no table item at exactly `version`."""
+        entry = self._entries.get(session_id)
+        if version is None or entry is None or entry[0] != version:
+            return False
+        self._entries.move_to_end(session_id)
+        return not entry[1]
+
+    def remember(self, session_id, version, has_item):
+        self._entries[session_id] = (version, has_item)
+        self._entries.move_to_end(session_id)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+    def forget(self, session_id):
+        self._entries.pop(session_id, None)
@@ -0,0 +1,210 @@
+"""
+Incident surge detection for outage-prone intents (Wi-Fi, VPN, ...).
+
+Every new request for a watched intent bumps an atomic per-minute counter.
+The sliding window is the sum of the last `window_seconds` of buckets, and
+the baseline is the average window over the preceding `baseline_windows`
+windows (cached per container, it moves slowly). A window at least
+`factor` times the baseline, and at least `min_count`, is a surge.
+
+A surge opens a single incident per intent with a conditional put. Sessions
+that hit the intent while it is open are attached to it, and the user is
+told IT already knows, instead of one escalation per user. Attaching bumps
+the incident's `affected` counter (every attached report, not distinct
+sessions), so the item stays the same size however large the outage.
+Incidents lapse `incident_ttl` seconds after the last surge reading, or
+when IT deletes or closes the item.
+
+DynamoCounterStore keeps the counters and incidents in the Incidents table;
+LocalCounterStore is an in-memory stand-in with the same interface for local
+runs and tests.
+"""
+import time
+from botocore.exceptions import ClientError
+from assistiq.fanout import gather
+
+def _conditional_failed(e):
+    return isinstance(e, ClientError) and e.response["Error"]["Code"] == "ConditionalCheckFailedException"
+
+def _counter_id(intent_name, bucket):
+    return f"count#{intent_name}#{bucket}"
+
+def _incident_id(intent_name):
+    return f"incident#{intent_name}"
+
+class DynamoCounterStore:
+    def __init__(self, table, dynamodb):
+        self.table = table
+        self.dynamodb = dynamodb
+
+    def incr(self, intent_name, bucket, expires_at):
+        resp = self.table.update_item(
+            Key={"id": _counter_id(intent_name, bucket)},
+            UpdateExpression="ADD #n :one SET expires_at = if_not_exists(expires_at, :exp)",
+            ExpressionAttributeNames={"#n": "count"},
+            ExpressionAttributeValues={":one": 1, ":exp": expires_at},
+            ReturnValues="UPDATED_NEW",
+        )
+        return int(resp["Attributes"]["count"])
+
+    def counts(self, intent_name, buckets):
+        """{bucket: count} for the given buckets (missing buckets are 0)."""
+        keys = [{"id": _counter_id(intent_name, b)} for b in buckets]
+        found = {}
+        for start in range(0, len(keys), 100):
+            request = {self.table.name: {"Keys": keys[start:start + 100]}}
+            while request:
+                resp = self.dynamodb.batch_get_item(RequestItems=request)
+                for item in resp.get("Responses", {}).get(self.table.name, []):
+                    found[item["id"]] = int(item.get("count", 0))
+                request = resp.get("UnprocessedKeys") or {}
+        return {b: found.get(_counter_id(intent_name, b), 0) for b in buckets}
+
+    def incident(self, intent_name):
+        return self.table.get_item(Key={"id": _incident_id(intent_name)}).get("Item")
+
+    def open_incident(self, intent_name, session_id, now, expires_at):
+        """Open the intent's incident; returns True if this call created it."""
+        try:
+            self.table.put_item(
+                Item={
+                    "id": _incident_id(intent_name),
+                    "intent_name": intent_name,
+                    "status": "open",
+                    "opened_at": now,
+                    "expires_at": expires_at,
+                    "affected": 1,
+                },
+                ConditionExpression="attribute_not_exists(id) OR expires_at < :now OR #st <> :open",
+                ExpressionAttributeNames={"#st": "status"},
+                ExpressionAttributeValues={":now": now, ":open": "open"},
+            )
+            return True
+        except Exception as e:
+            if _conditional_failed(e):
+                return False
+            raise
+
+    def attach(self, intent_name, session_id, expires_at=None):
+        update = "ADD affected :one"
+        values = {":one": 1}
+        if expires_at:
+            update += " SET expires_at = :exp"
+            values[":exp"] = expires_at
+        self.table.update_item(
+            Key={"id": _incident_id(intent_name)},
+            UpdateExpression=update,
+            ExpressionAttributeValues=values,
+        )
+
+class LocalCounterStore:
+    def __init__(self):
+        self.items = {}
+
+    def incr(self, intent_name, bucket, expires_at):
+        key = _counter_id(intent_name, bucket)
+        self.items[key] = self.items.get(key, 0) + 1
+        return self.items[key]
+
+    def counts(self, intent_name, buckets):
+        return {b: self.items.get(_counter_id(intent_name, b), 0) for b in buckets}
+
+    def incident(self, intent_name):
+        return self.items.get(_incident_id(intent_name))
+
+    def open_incident(self, intent_name, session_id, now, expires_at):
+        current = self.incident(intent_name)
+        if current and current["status"] == "open" and current["expires_at"] >= now:
+            return False
+        self.items[_incident_id(intent_name)] = {
+            "id": _incident_id(intent_name), "intent_name": intent_name, "status": "open",
+            "opened_at": now, "expires_at": expires_at, "affected": 1,
+        }
+        return True
+
+    def attach(self, intent_name, session_id, expires_at=None):
+        incident = self.items[_incident_id(intent_name)]
+        incident["affected"] += 1
+        if expires_at:
+            incident["expires_at"] = expires_at
+
+class SurgeDetector:
+    def __init__(self, store, intents, window_seconds=300, bucket_seconds=60,
+                 baseline_windows=12, min_count=10, factor=3.0,
+                 incident_ttl=7200, cache_seconds=30, clock=time.time):
+        self.store = store
+        self.intents = set(intents)
+        self.window_seconds = window_seconds
+        self.bucket_seconds = bucket_seconds
+        self.baseline_windows = baseline_windows
+        self.min_count = min_count
+        self.factor = factor
+        self.incident_ttl = incident_ttl
+        self.cache_seconds = cache_seconds
+        self.clock = clock
+        self._baseline = {}   # intent -> (computed_at, baseline)
+        self._incidents = {}  # intent -> (fetched_at, incident or None)
+
+    def _buckets(self, now):
+        current = int(now // self.bucket_seconds)
+        per_window = max(1, self.window_seconds // self.bucket_seconds)
+        window = list(range(current - per_window + 1, current + 1))
+        history = list(range(window[0] - per_window * self.baseline_windows, window[0]))
+        return current, window, history
+
+    def _baseline_for(self, intent_name, history, now):
+        cached = self._baseline.get(intent_name)
+        if cached and now - cached[0] < self.cache_seconds:
+            return cached[1]
+        counts = self.store.counts(intent_name, history)
+        baseline = sum(counts.values()) / max(self.baseline_windows, 1)
+        self._baseline[intent_name] = (now, baseline)
+        return baseline
+
+    def open_incident(self, intent_name):
+        """The intent's open incident (cached briefly), or None."""
+        now = self.clock()
+        cached = self._incidents.get(intent_name)
+        if cached and now - cached[0] < self.cache_seconds:
+            incident = cached[1]
+        else:
+            incident = self.store.incident(intent_name)
+            self._incidents[intent_name] = (now, incident)
+        if incident and incident.get("status") == "open" and int(incident.get("expires_at", 0)) >= now:
+            return incident
+        return None
+
+    def observe(self, intent_name, session_id, timeout=None):
+        """Count a request; returns (incident, opened) when it belongs to an incident, else (None, False).
+
+        `opened` is True for the one call that opened the incident. The
+        counter reads are gathered within `timeout` seconds (default: the
+        fanout default).
+        """
+        if intent_name not in self.intents:
+            return None, False
+        now = self.clock()
+        current, window, history = self._buckets(now)
+        expires = int(now) + self.window_seconds * (self.baseline_windows + 2)
+        # The increment returns the current bucket; the other reads don't depend on it
+        current_count, earlier, baseline, incident = gather(
+            lambda: self.store.incr(intent_name, current, expires),
+            lambda: self.store.counts(intent_name, window[:-1]),
+            lambda: self._baseline_for(intent_name, history, now),
+            lambda: self.open_incident(intent_name),
+            timeout=timeout,
+        )
+        in_window = current_count + sum(earlier.values())
+
+        surging = in_window >= max(self.min_count, self.factor * baseline)
+        if not surging and incident is None:
+            return None, False
+
+        expires_at = int(now) + self.incident_ttl
+        opened = False
+        if incident is None:
+            opened = self.store.open_incident(intent_name, session_id, int(now), expires_at)
+        if not opened:
+            self.store.attach(intent_name, session_id, expires_at if surging else None)
+        self._incidents.pop(intent_name, None)
+        return self.open_incident(intent_name) or {"intent_name": intent_name}, opened
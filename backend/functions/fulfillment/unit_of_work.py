@@ -0,0 +1,109 @@
+"""
+Unit of work for the writes made while handling one fulfillment turn.
+
+Writes (the turn's log record, session-state puts and deletes) are queued
+instead of executed. `commit()` sends them as one TransactWriteItems call, so
+"log the turn and clear the session" lands atomically in a single round
+trip; a lone write goes out as a plain call. If the transaction fails, each
+write is retried on its own (concurrently) so one bad item cannot drop the
+others. Only the
+last write per item is kept, as a transaction may not touch an item twice.
+
+An update can ask for the value it leaves in an attribute it sets with
+`if_not_exists` (`read_back`). A transaction cannot return values, so there
+the update is conditioned on the attribute being absent: a first write
+stores the given value, and a repeated one cancels the transaction; the
+individual UpdateItem then reads back the value already stored.
+"""
+from boto3.dynamodb.types import TypeSerializer
+from assistiq.fanout import gather
+
+_serializer = TypeSerializer()
+
+def _serialize(mapping):
+    return {k: _serializer.serialize(v) for k, v in mapping.items()}
+
+class UnitOfWork:
+    def __init__(self, client):
+        self.client = client
+        self._ops = {}
+        # (table name, id) -> value stored in a `read_back` attribute, after commit()
+        self.stored = {}
+
+    def __len__(self):
+        return len(self._ops)
+
+    def put(self, table, item):
+        self._ops[(table.name, item["id"])] = ("Put", table, {"Item": item}, None)
+
+    def delete(self, table, key):
+        self._ops[(table.name, key["id"])] = ("Delete", table, {"Key": key}, None)
+
+    def update(self, table, update_kwargs, read_back=None):
+        """`update_kwargs` are UpdateItem arguments (Key, UpdateExpression, ...).
+
+        `read_back` is (attribute, value the update sets if it is absent).
+        """
+        self._ops[(table.name, update_kwargs["Key"]["id"])] = ("Update", table, update_kwargs, read_back)
+
+    def commit(self, timeout=None):
+        """Flush the queued writes; returns True if every write succeeded.
+
+        Individual writes are gathered within `timeout` seconds (default: the
+        fanout default); the transaction is one call, bounded by the client's
+        read timeout.
+        """
+        ops = list(self._ops.values())
+        self._ops.clear()
+        if not ops:
+            return True
+        if len(ops) > 1:
+            try:
+                self.client.transact_write_items(TransactItems=[self._transact_item(op) for op in ops])
+                for _, table, kwargs, read_back in ops:
+                    if read_back:
+                        self.stored[(table.name, kwargs["Key"]["id"])] = read_back[1]
+                return True
+            except Exception as e:
+                print("UnitOfWork transaction failed, writing items individually:", e)
+        try:
+            return all(gather(*[lambda op=op: self._write_one(op, self.stored) for op in ops], timeout=timeout))
+        except Exception as e:
+            print("UnitOfWork individual writes did not finish:", e)
+            return False
+
+    @staticmethod
+    def _transact_item(op):
+        kind, table, kwargs, read_back = op
+        item = {"TableName": table.name}
+        if kind == "Put":
+            item["Item"] = _serialize(kwargs["Item"])
+        else:
+            item["Key"] = _serialize(kwargs["Key"])
+        if kind == "Update":
+            item["UpdateExpression"] = kwargs["UpdateExpression"]
+            item["ExpressionAttributeNames"] = kwargs["ExpressionAttributeNames"]
+            item["ExpressionAttributeValues"] = _serialize(kwargs["ExpressionAttributeValues"])
+            if read_back:
+                item["ExpressionAttributeNames"] = {**item["ExpressionAttributeNames"], "#rb": read_back[0]}
+                item["ConditionExpression"] = "attribute_not_exists(#rb)"
+        return {kind: item}
+
+    @staticmethod
+    def _write_one(op, stored):
+        kind, table, kwargs, read_back = op
+        try:
+            if kind == "Put":
+                table.put_item(**kwargs)
+            elif kind == "Delete":
+                table.delete_item(**kwargs)
+            elif read_back:
+                resp = table.update_item(ReturnValues="UPDATED_NEW", **kwargs)
+                attribute, value = read_back
+                stored[(table.name, kwargs["Key"]["id"])] = resp.get("Attributes", {}).get(attribute, value)
+            else:
+                table.update_item(**kwargs)
+            return True
+        except Exception as e:
+            print(f"UnitOfWork {kind} on {table.name} failed:", e)
+            return False
@@ -0,0 +1,73 @@
+import os
+import boto3
+from assistiq import conversation_log
+from assistiq.budget import TimeBudget, client_config
+from assistiq.queues import sqs_messages
+
+# --- DynamoDB ---
+dynamodb = boto3.resource("dynamodb", config=client_config())
+chatlog_table = dynamodb.Table(os.environ["LOGS_TABLE_NAME"])
+
+# Deadline for one batch's writes (the invocation's remaining time caps it further)
+WRITE_TIMEOUT_SECONDS = float(os.environ.get("LOG_WRITE_TIMEOUT_SECONDS", "15"))
+
+def write_record(record):
+    """Merge one turn's record into its ChatLogs item; True once written.
+
+    An UpdateItem rather than a put: records for the same turn can arrive in
+    different batches and in any order, and each only adds its fields.
+    """
+    try:
+        chatlog_table.update_item(**conversation_log.record_update(record))
+        return True
+    except Exception as e:
+        # Throttling included, after boto3's own retries
+        print(f"log write failed for {record.get('id')}:", e)
+        return False
+
+def _merge(older, newer):
+    """Two records for the same turn: the later fields win, the first timestamps stay."""
+    merged = {**older, **newer}
+    for key in ("timestamp", "turn_ts"):
+        if older.get(key):
+            merged[key] = min(older[key], newer.get(key) or older[key])
+    return merged
+
+def lambda_handler(event, context):
+    """SQS-triggered: writes queued turn records, reporting the ones not written.
+
+    Failed messages are retried by SQS and, after the queue's
+    maxReceiveCount, moved to the log dead-letter queue. Writes are merges,
+    so a redelivered record is harmless.
+    """
+    failures = []
+    records = {}  # turn id -> (record, message ids)
+    for message_id, message in sqs_messages(event):
+        try:
+            conversation_log.record_update(message)
+            turn_id = message["id"]
+        except Exception as e:
+            print("bad log record:", e)
+            failures.append({"itemIdentifier": message_id})
+            continue
+        # One write per turn in this batch
+        if turn_id in records:
+            previous, ids = records[turn_id]
+            records[turn_id] = (_merge(previous, message), ids + [message_id])
+        else:
+            records[turn_id] = (message, [message_id])
+
+    turn_ids = list(records)
+    try:
+        written = TimeBudget(context).run(
+            *[lambda t=t: write_record(records[t][0]) for t in turn_ids], cap=WRITE_TIMEOUT_SECONDS
+        )
+    except Exception as e:
+        print("log writes did not finish:", e)
+        written = [False] * len(turn_ids)
+    for turn_id, ok in zip(turn_ids, written):
+        if not ok:
+            failures.extend({"itemIdentifier": m} for m in records[turn_id][1])
+
+    print(f"Log writer: {len(records)} turns, {len(failures)} messages failed")
+    return {"batchItemFailures": failures}
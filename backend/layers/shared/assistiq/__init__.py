@@ -0,0 +1 @@
+"""Code shared by the AssistIQ Lambdas (deployed as the SharedLayer)."""
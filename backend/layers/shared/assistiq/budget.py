@@ -0,0 +1,77 @@
+"""
+Per-invocation time budget derived from the Lambda context deadline.
+
+A handler creates one TimeBudget per invocation. Downstream calls get a
+timeout derived from what is left (less a reserve for returning the
+response), optional work asks `allows()` first, and work that is skipped or
+deferred is recorded with `degrade()` and reported once, as a single JSON
+log line, by `report()`.
+
+A call that misses its deadline keeps running in the background, so every
+boto3 client is built with `client_config()`: botocore's own connect/read
+timeouts and retry limit bound how long an abandoned call can hold a fanout
+worker, instead of the 60 s defaults.
+"""
+import os
+import json
+import time
+from botocore.config import Config
+from assistiq.fanout import gather, FanoutTimeout
+
+RESERVE_SECONDS = float(os.environ.get("BUDGET_RESERVE_SECONDS", "0.5"))
+CONNECT_TIMEOUT_SECONDS = float(os.environ.get("AWS_CONNECT_TIMEOUT_SECONDS", "1"))
+READ_TIMEOUT_SECONDS = float(os.environ.get("AWS_READ_TIMEOUT_SECONDS", "2"))
+MAX_ATTEMPTS = int(os.environ.get("AWS_MAX_ATTEMPTS", "3"))
+
+def client_config(read_timeout=READ_TIMEOUT_SECONDS, max_attempts=MAX_ATTEMPTS):
+    """botocore Config for a client whose calls are budgeted at `read_timeout` seconds each."""
+    return Config(
+        connect_timeout=min(CONNECT_TIMEOUT_SECONDS, read_timeout),
+        read_timeout=read_timeout,
+        retries={"max_attempts": max_attempts, "mode": "standard"},
+    )
+
+class TimeBudget:
+    def __init__(self, context=None, limit_seconds=None, reserve_seconds=RESERVE_SECONDS, clock=time.monotonic):
+        """`limit_seconds` caps the budget below the function timeout (e.g. a caller's own deadline)."""
+        self.clock = clock
+        remaining = None
+        if context is not None and hasattr(context, "get_remaining_time_in_millis"):
+            remaining = context.get_remaining_time_in_millis() / 1000.0
+        if limit_seconds:
+            remaining = limit_seconds if remaining is None else min(remaining, limit_seconds)
+        self.deadline = None if remaining is None else clock() + remaining - reserve_seconds
+        self.degraded = []
+
+    def remaining(self):
+        """Seconds left (infinite without a context or limit)."""
+        if self.deadline is None:
+            return float("inf")
+        return max(self.deadline - self.clock(), 0.0)
+
+    def timeout(self, cap):
+        """Timeout for one downstream call: what is left, at most `cap` seconds."""
+        return min(self.remaining(), cap)
+
+    def allows(self, seconds):
+        return self.remaining() >= seconds
+
+    def run(self, *calls, cap):
+        """fanout.gather the calls with a deadline from the budget."""
+        timeout = self.timeout(cap)
+        if timeout <= 0:
+            raise FanoutTimeout("time budget exhausted")
+        return gather(*calls, timeout=timeout)
+
+    def degrade(self, what):
+        """Record optional work that was skipped or deferred."""
+        self.degraded.append(what)
+
+    def report(self, **fields):
+        if self.degraded:
+            print(json.dumps({
+                "event": "degraded_response",
+                "degraded": self.degraded,
+                "remaining_seconds": round(min(self.remaining(), 1e6), 3),
+                **fields,
+            }, default=str))
@@ -0,0 +1,143 @@
+"""
+Compiled, read-only snapshot of the intent / FAQ catalog.
+
+`scripts/build_catalog.py` compiles `scripts/intents.json` and
+`scripts/seed_faq.json` into `catalog.snap` next to this module, so the
+snapshot ships inside the SharedLayer. At init the file is memory-mapped;
+lookups binary-search the key index in place and only decode the records
+that are actually used.
+
+File layout (little endian):
+
+    header   magic "AIQC", format u16, record count u32, version 32s
+    index    count x (key offset u32, key length u16, value offset u32, value length u32),
+             sorted by key
+    data     UTF-8 keys and compact JSON values
+
+Keys are "intent:<id>" and "faq:<id>". The version is a hash of the source
+content; the seed scripts write the same hash to the catalog version item,
+so DynamoDB can tell the functions when the snapshot is out of date.
+"""
+import os
+import json
+import mmap
+import struct
+import hashlib
+
+MAGIC = b"AIQC"
+FORMAT = 1
+_HEADER = struct.Struct("<4sHI32s")
+_ENTRY = struct.Struct("<IHII")
+
+INTENT_PREFIX = "intent:"
+FAQ_PREFIX = "faq:"
+
+DEFAULT_PATH = os.path.join(os.path.dirname(__file__), "catalog.snap")
+
+def _canonical(obj):
+    return json.dumps(obj, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+def catalog_version(intents, faqs):
+    """Content hash shared by the snapshot and the `__catalog_version__` item."""
+    digest = hashlib.sha256(_canonical({"intents": intents, "faqs": faqs}).encode("utf-8"))
+    return digest.hexdigest()[:32]
+
+def compile_snapshot(intents, faqs):
+    """Serialise the catalog into the snapshot format; returns bytes."""
+    records = {}
+    for it in intents:
+        if it.get("id"):
+            records[INTENT_PREFIX + it["id"]] = it
+    for faq in faqs:
+        if faq.get("id"):
+            records[FAQ_PREFIX + str(faq["id"])] = faq
+
+    keys = sorted(records)
+    data = bytearray()
+    index = []
+    data_start = _HEADER.size + _ENTRY.size * len(keys)
+    for key in keys:
+        k = key.encode("utf-8")
+        v = _canonical(records[key]).encode("utf-8")
+        key_off = data_start + len(data)
+        data += k
+        index.append(_ENTRY.pack(key_off, len(k), key_off + len(k), len(v)))
+        data += v
+
+    header = _HEADER.pack(MAGIC, FORMAT, len(keys), catalog_version(intents, faqs).encode("ascii"))
+    return header + b"".join(index) + bytes(data)
+
+class CatalogSnapshot:
+    def __init__(self, buf):
+        magic, fmt, count, version = _HEADER.unpack_from(buf, 0)
+        if magic != MAGIC or fmt != FORMAT:
+            raise ValueError("not a catalog snapshot (format %r)" % fmt)
+        self._buf = buf
+        self.count = count
+        self.version = version.rstrip(b"\0").decode("ascii")
+        self._decoded = {}
+
+    @classmethod
+    def open(cls, path=DEFAULT_PATH):
+        with open(path, "rb") as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(buf)
+
+    def _entry(self, i):
+        return _ENTRY.unpack_from(self._buf, _HEADER.size + i * _ENTRY.size)
+
+    def _key(self, i):
+        key_off, key_len, _, _ = self._entry(i)
+        return self._buf[key_off:key_off + key_len].decode("utf-8")
+
+    def _value(self, i):
+        if i not in self._decoded:
+            _, _, val_off, val_len = self._entry(i)
+            self._decoded[i] = json.loads(self._buf[val_off:val_off + val_len].decode("utf-8"))
+        return self._decoded[i]
+
+    def _lower_bound(self, key):
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def get(self, key):
+        i = self._lower_bound(key)
+        if i < self.count and self._key(i) == key:
+            return self._value(i)
+        return None
+
+    def items(self, prefix=""):
+        """(key, record) pairs whose key starts with `prefix`, in key order."""
+        i = self._lower_bound(prefix)
+        while i < self.count:
+            key = self._key(i)
+            if not key.startswith(prefix):
+                break
+            yield key, self._value(i)
+            i += 1
+
+    def intent(self, intent_id):
+        return self.get(INTENT_PREFIX + intent_id)
+
+    def intents(self):
+        return [record for _, record in self.items(INTENT_PREFIX)]
+
+    def faqs(self):
+        return [record for _, record in self.items(FAQ_PREFIX)]
+
+def load_snapshot(path=None):
+    """Memory-map the bundled snapshot; None when it is missing or unreadable."""
+    path = path or os.environ.get("CATALOG_SNAPSHOT_PATH") or DEFAULT_PATH
+    try:
+        return CatalogSnapshot.open(path)
+    except FileNotFoundError:
+        print(f"[WARN] catalog snapshot not found at {path}; using DynamoDB only")
+    except Exception as e:
+        print(f"[WARN] catalog snapshot at {path} unusable: {e}")
+    return None
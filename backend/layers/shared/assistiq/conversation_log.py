@@ -0,0 +1,203 @@
+"""
+One ChatLogs record per conversation turn, shared by the chat proxy and the
+fulfillment Lambda.
+
+The chat proxy mints a turn id and passes it to Lex as a request attribute;
+Lex forwards it to the fulfillment Lambda. Whichever side writes the turn
+uses that id as the item key and merges its fields with an UpdateItem, so
+retries and repeated code-hook invocations update the same record instead
+of adding rows. When fulfillment has logged the turn it reports the turn id
+and turn_ts back through Lex session attributes and the proxy skips its own
+write.
+
+Turn records can also be written behind: `log_turn` pushes the complete
+record to the log queue, so a chat turn doesn't wait on (or lose its record
+to) a throttled ChatLogs table. The log writer function merges each record
+into its turn's item with the same UpdateItem (`record_update`), whatever
+order the queue delivers them in: the first write fixes `timestamp` and
+`turn_ts`, later ones only add their fields.
+"""
+import uuid
+from decimal import Decimal
+from datetime import datetime
+from boto3.dynamodb.conditions import Key
+
+# Request attribute carrying the proxy's turn id into the fulfillment event
+TURN_ID_ATTR = "x-assistiq-turn-id"
+# Request attribute set when the proxy minted the session id for this turn,
+# i.e. the session cannot have any state yet
+NEW_SESSION_ATTR = "x-assistiq-new-session"
+# Prefix of session ids minted by the chat proxy. Such sessions started after
+# dialog state moved to Lex session attributes, so with the lex backend they
+# never have a session-table item, even on a later first turn through Lex.
+MINTED_SESSION_PREFIX = "aiq-"
+# Session attributes fulfillment sets once it has written the turn
+LOGGED_TURN_ATTR = "aiq_logged_turn"
+LOGGED_TURN_TS_ATTR = "aiq_logged_turn_ts"
+# Session attribute carrying fulfillment's pending dialog state ("" when none)
+DIALOG_STATE_ATTR = "aiq_state"
+
+DEFAULT_SESSION_INDEX = "SessionTurnsIndex"
+
+def new_turn_id():
+    return str(uuid.uuid4())
+
+def new_session_id():
+    return f"{MINTED_SESSION_PREFIX}{uuid.uuid4()}"
+
+def minted_session(session_id):
+    return bool(session_id) and session_id.startswith(MINTED_SESSION_PREFIX)
+
+def turn_ts(dt=None):
+    """Sortable turn timestamp used as the range key of the session index."""
+    return (dt or datetime.utcnow()).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+def turn_update(turn_id, session_id, user_text=None, bot_reply=None,
+                intent_name=None, confidence=None, now=None):
+    """UpdateItem arguments that create or enrich the record for one turn.
+
+    The first writer fixes `timestamp` / `turn_ts`; later writes for the same
+    turn id only merge in the fields they know. Returns (kwargs, turn_ts).
+    """
+    now = now or datetime.utcnow()
+    fields = {
+        "session_id": session_id,
+        "user_text": user_text,
+        "bot_reply": bot_reply,
+        "intent_name": intent_name,
+        "confidence": Decimal(str(confidence)) if confidence is not None else None,
+    }
+    fields = {k: v for k, v in fields.items() if v is not None}
+    kwargs = _merge_update(turn_id, fields, now.strftime("%Y-%m-%dT%H:%M:%SZ"), turn_ts(now))
+    return kwargs, kwargs["ExpressionAttributeValues"][":tts"]
+
+def _merge_update(turn_id, fields, timestamp, ts):
+    names = {"#ts": "timestamp", "#tts": "turn_ts"}
+    values = {":ts": timestamp, ":tts": ts}
+    sets = ["#ts = if_not_exists(#ts, :ts)", "#tts = if_not_exists(#tts, :tts)"]
+    for i, (name, value) in enumerate(fields.items()):
+        names[f"#f{i}"] = name
+        values[f":f{i}"] = value
+        sets.append(f"#f{i} = :f{i}")
+
+    return {
+        "Key": {"id": turn_id},
+        "UpdateExpression": "SET " + ", ".join(sets),
+        "ExpressionAttributeNames": names,
+        "ExpressionAttributeValues": values,
+    }
+
+def record_turn(table, turn_id, session_id, user_text=None, bot_reply=None,
+                intent_name=None, confidence=None):
+    """Write the record for one turn now; returns its turn_ts, or None on failure."""
+    kwargs, ts = turn_update(turn_id, session_id, user_text, bot_reply, intent_name, confidence)
+    try:
+        resp = table.update_item(ReturnValues="UPDATED_NEW", **kwargs)
+        return resp.get("Attributes", {}).get("turn_ts", ts)
+    except Exception as e:
+        print(f"[ERROR] record_turn failed for {session_id}/{turn_id}: {e}")
+        return None
+
+def turn_record(turn_id, session_id, user_text=None, bot_reply=None,
+                intent_name=None, confidence=None, now=None):
+    """The complete record for one turn, as a JSON-safe dict for the log queue."""
+    now = now or datetime.utcnow()
+    record = {
+        "id": turn_id,
+        "session_id": session_id,
+        "user_text": user_text,
+        "bot_reply": bot_reply,
+        "intent_name": intent_name,
+        "confidence": float(confidence) if confidence is not None else None,
+        "timestamp": now.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "turn_ts": turn_ts(now),
+    }
+    return {k: v for k, v in record.items() if v is not None}
+
+def record_item(record):
+    """ChatLogs item for a queued turn record."""
+    item = dict(record)
+    if item.get("confidence") is not None:
+        item["confidence"] = Decimal(str(item["confidence"]))
+    return item
+
+def record_update(record):
+    """UpdateItem arguments that merge a queued turn record into its item."""
+    item = record_item(record)
+    fields = {k: v for k, v in item.items() if k not in ("id", "timestamp", "turn_ts")}
+    return _merge_update(item["id"], fields, item["timestamp"], item["turn_ts"])
+
+def log_turn(queue, table, turn_id, session_id, **fields):
+    """Queue the turn's record for the log writer; returns its turn_ts.
+
+    Without a queue, or if the send fails, the turn is written directly.
+    """
+    if queue is not None:
+        record = turn_record(turn_id, session_id, **fields)
+        try:
+            queue.send(record)
+            return record["turn_ts"]
+        except Exception as e:
+            print(f"[WARN] log queue send failed for {session_id}/{turn_id}, writing directly: {e}")
+    return record_turn(table, turn_id, session_id, **fields)
+
+def logged_turn_attributes(turn_id, logged_ts):
+    """Session attributes telling the proxy this turn is already logged."""
+    return {LOGGED_TURN_ATTR: turn_id, LOGGED_TURN_TS_ATTR: logged_ts}
+
+def logged_turn_ts(session_attributes, turn_id):
+    """turn_ts fulfillment reported for `turn_id`, or None if it did not log it."""
+    attrs = session_attributes or {}
+    if attrs.get(LOGGED_TURN_ATTR) == turn_id:
+        return attrs.get(LOGGED_TURN_TS_ATTR)
+    return None
+
+def query_session_turns(table, session_id, after=None, limit=None,
+                        index_name=DEFAULT_SESSION_INDEX, raise_errors=False):
+    """A session's turns from the session index, oldest first.
+
+    `after` is an exclusive turn_ts cursor. With `limit` a single page is
+    read; returns (items, more) where `more` says whether turns remain.
+    On errors the turns read so far are returned, unless `raise_errors`.
+    """
+    cond = Key("session_id").eq(session_id)
+    if after:
+        cond = cond & Key("turn_ts").gt(after)
+    kwargs = {"IndexName": index_name, "KeyConditionExpression": cond}
+    if limit:
+        kwargs["Limit"] = limit
+    items = []
+    try:
+        while True:
+            resp = table.query(**kwargs)
+            items.extend(resp.get("Items", []))
+            if "LastEvaluatedKey" not in resp:
+                return items, False
+            if limit:
+                return items, True
+            kwargs["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+    except Exception as e:
+        if raise_errors:
+            raise
+        print(f"[WARN] history query failed for {session_id}: {e}")
+    return items, False
+
+def iter_session_turns(table, session_id, page_size=100,
+                       index_name=DEFAULT_SESSION_INDEX):
+    """Yield a session's turns oldest first, one Query page at a time.
+
+    Unlike query_session_turns nothing is accumulated, so callers that
+    render or count turns use memory independent of the session length.
+    Errors are raised to the caller.
+    """
+    kwargs = {
+        "IndexName": index_name,
+        "KeyConditionExpression": Key("session_id").eq(session_id),
+        "Limit": page_size,
+    }
+    while True:
+        resp = table.query(**kwargs)
+        yield from resp.get("Items", [])
+        if "LastEvaluatedKey" not in resp:
+            return
+        kwargs["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
@@ -0,0 +1,104 @@
+"""
+Degradation controller for DynamoDB throttling and error spikes.
+
+`attach()` hooks the controller into a boto3 client's `needs-retry` events,
+so it sees the outcome of every DynamoDB attempt the container makes,
+retries included, without touching the call sites. Throttling errors,
+unprocessed batch keys, 5xx responses and connection errors are failures;
+expected client errors (e.g. a failed condition check) are not.
+
+When the last `window_seconds` hold `throttle_threshold` throttled attempts,
+or at least `min_calls` attempts with an error share of `error_rate`, the
+controller trips: `degraded()` is True for `cooldown_seconds`, and handlers
+stay off optional DynamoDB work. It then recovers on its own with a fresh
+window; tripping again soon after doubles the cooldown (up to
+`max_cooldown_seconds`).
+"""
+import os
+import time
+import threading
+from collections import deque
+
+THROTTLE_CODES = {
+    "ProvisionedThroughputExceededException",
+    "ThrottlingException",
+    "RequestLimitExceeded",
+}
+
+class DegradationController:
+    def __init__(self, window_seconds=30, throttle_threshold=3, error_rate=0.5, min_calls=10,
+                 cooldown_seconds=30, max_cooldown_seconds=300, clock=time.monotonic):
+        self.window_seconds = window_seconds
+        self.throttle_threshold = throttle_threshold
+        self.error_rate = error_rate
+        self.min_calls = min_calls
+        self.cooldown_seconds = cooldown_seconds
+        self.max_cooldown_seconds = max_cooldown_seconds
+        self.clock = clock
+        self._events = deque()  # (time, failed, throttled)
+        self._lock = threading.Lock()
+        self._until = 0.0
+        self._cooldown = cooldown_seconds
+        self.trips = 0
+
+    def attach(self, client):
+        client.meta.events.register("needs-retry.dynamodb", self._on_attempt)
+        return self
+
+    def degraded(self):
+        return self.clock() < self._until
+
+    def record(self, failed=False, throttled=False):
+        now = self.clock()
+        with self._lock:
+            if now < self._until:
+                return
+            self._events.append((now, failed, throttled))
+            while self._events and self._events[0][0] < now - self.window_seconds:
+                self._events.popleft()
+            throttles = sum(1 for e in self._events if e[2])
+            failures = sum(1 for e in self._events if e[1])
+            if throttles >= self.throttle_threshold or (
+                len(self._events) >= self.min_calls and failures / len(self._events) >= self.error_rate
+            ):
+                self._trip(now, throttles, failures)
+
+    def _trip(self, now, throttles, failures):
+        # A trip within one cooldown of the last recovery backs off further
+        if self.trips and now - self._until < self._cooldown:
+            self._cooldown = min(self._cooldown * 2, self.max_cooldown_seconds)
+        else:
+            self._cooldown = self.cooldown_seconds
+        self._until = now + self._cooldown
+        self._events.clear()
+        self.trips += 1
+        print(f"[WARN] DynamoDB degraded for {self._cooldown:.0f}s: "
+              f"{throttles} throttled, {failures} failed in the last {self.window_seconds}s")
+
+    def _on_attempt(self, response=None, caught_exception=None, **kwargs):
+        if caught_exception is not None:
+            self.record(failed=True)
+            return None
+        if response is None:
+            return None
+        http, parsed = response
+        parsed = parsed or {}
+        code = (parsed.get("Error") or {}).get("Code")
+        reasons = {r.get("Code") for r in parsed.get("CancellationReasons") or []}
+        throttled = (
+            code in THROTTLE_CODES
+            or "ThrottlingError" in reasons
+            or bool(parsed.get("UnprocessedKeys") or parsed.get("UnprocessedItems"))
+        )
+        failed = http.status_code >= 500 or code in THROTTLE_CODES
+        self.record(failed=failed, throttled=throttled)
+        # Never decides the retry itself
+        return None
+
+def controller_from_env():
+    return DegradationController(
+        window_seconds=float(os.environ.get("DEGRADE_WINDOW_SECONDS", "30")),
+        throttle_threshold=int(os.environ.get("DEGRADE_THROTTLE_THRESHOLD", "3")),
+        error_rate=float(os.environ.get("DEGRADE_ERROR_RATE", "0.5")),
+        cooldown_seconds=float(os.environ.get("DEGRADE_COOLDOWN_SECONDS", "30")),
+    )
@@ -0,0 +1,205 @@
+"""
+Escalation ledger: at most one IT ticket per (session, issue) per window.
+
+The escalation worker opens a ticket with a conditional PutItem before it
+reads the transcript or sends anything. If a ticket for the same session
+and issue is already open inside the window, the escalation is appended to
+it instead (the turn id is added to the ticket, no scan, no email). The
+append is conditional on the turn id not being recorded yet, so Lex,
+Lambda and SQS retries of one turn are no-ops.
+
+A ticket whose email failed, or whose worker died before sending
+(`pending` for longer than `pending_timeout`), can be claimed again so the
+retry still sends it. The claim is an UpdateItem, so the turn ids already
+appended to the ticket are kept.
+
+Tickets batched into a digest wait as `queued`; only those carry
+`digest_recipient`, so the sparse DIGEST_INDEX lists exactly the tickets
+each recipient's next digest has to include. A flush claims each ticket
+(`queued` -> `sending`) before rendering it, so concurrent flushes (the
+schedule and the size threshold, on more than one worker) never email the
+same ticket twice; a claim older than `pending_timeout` can be taken over,
+as with `pending` tickets.
+"""
+import time
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+
+PENDING = "pending"
+SENT = "sent"
+FAILED = "failed"
+QUEUED = "queued"
+SENDING = "sending"
+
+DIGEST_INDEX = "DigestQueueIndex"
+
+def ticket_id(session_id, issue_type):
+    return f"{session_id}#{issue_type}"
+
+def _conditional_failed(e):
+    return isinstance(e, ClientError) and e.response["Error"]["Code"] == "ConditionalCheckFailedException"
+
+class EscalationLedger:
+    def __init__(self, table, window_seconds=3600, pending_timeout=90, clock=time.time):
+        self.table = table
+        self.window_seconds = window_seconds
+        self.pending_timeout = pending_timeout
+        self.clock = clock
+
+    def open(self, session_id, issue_type, turn_id, digest_recipient=None):
+        """Claim a new ticket; returns the ticket item, or None if one is already open.
+
+        With `digest_recipient` the ticket is created `queued` for that
+        recipient's next digest instead of `pending` an immediate send.
+        """
+        now = int(self.clock())
+        tid = ticket_id(session_id, issue_type)
+        item = {
+            "id": tid,
+            "session_id": session_id,
+            "issue_type": issue_type,
+            "status": QUEUED if digest_recipient else PENDING,
+            "opened_at": now,
+            "turn_ids": {turn_id},
+            "updates": 0,
+            # DynamoDB TTL removes tickets once the window has passed
+            "expires_at": now + self.window_seconds,
+        }
+        if digest_recipient:
+            item["digest_recipient"] = digest_recipient
+        try:
+            self.table.put_item(
+                Item=item,
+                ConditionExpression="attribute_not_exists(id) OR opened_at < :window_start",
+                ExpressionAttributeValues={":window_start": now - self.window_seconds},
+            )
+            return item
+        except Exception as e:
+            if not _conditional_failed(e):
+                raise
+        return self._reclaim(tid, turn_id, item)
+
+    def _reclaim(self, tid, turn_id, item):
+        """Claim a failed or stale pending ticket in the window again; None if it is live."""
+        values = {
+            ":st": item["status"],
+            ":now": item["opened_at"],
+            ":exp": item["expires_at"],
+            ":turns": {turn_id},
+            ":stale": item["opened_at"] - self.pending_timeout,
+            ":failed": FAILED,
+            ":pending": PENDING,
+        }
+        expression = "SET #st = :st, opened_at = :now, expires_at = :exp"
+        if item.get("digest_recipient"):
+            values[":rcpt"] = item["digest_recipient"]
+            expression += ", digest_recipient = :rcpt"
+        else:
+            expression += " REMOVE digest_recipient"
+        try:
+            resp = self.table.update_item(
+                Key={"id": tid},
+                UpdateExpression=expression + " ADD turn_ids :turns",
+                ConditionExpression="#st = :failed OR (#st = :pending AND opened_at < :stale)",
+                ExpressionAttributeNames={"#st": "status"},
+                ExpressionAttributeValues=values,
+                ReturnValues="ALL_NEW",
+            )
+            return resp.get("Attributes") or item
+        except Exception as e:
+            if _conditional_failed(e):
+                return None
+            raise
+
+    def append(self, session_id, issue_type, turn_id):
+        """Record a repeat escalation on the open ticket; False if this turn is already on it."""
+        try:
+            self.table.update_item(
+                Key={"id": ticket_id(session_id, issue_type)},
+                UpdateExpression="ADD turn_ids :turns, updates :one SET last_update_at = :now",
+                ConditionExpression="attribute_exists(id) AND NOT contains(turn_ids, :turn)",
+                ExpressionAttributeValues={
+                    ":turns": {turn_id},
+                    ":turn": turn_id,
+                    ":one": 1,
+                    ":now": int(self.clock()),
+                },
+            )
+            return True
+        except Exception as e:
+            if _conditional_failed(e):
+                return False
+            raise
+
+    def mark_sent(self, tid, message_id=None):
+        self._set_status(tid, SENT, message_id)
+
+    def mark_failed(self, tid):
+        self._set_status(tid, FAILED)
+
+    def queued(self, recipient, limit=50):
+        """Tickets waiting for `recipient`'s digest, oldest first."""
+        try:
+            resp = self.table.query(
+                IndexName=DIGEST_INDEX,
+                KeyConditionExpression=Key("digest_recipient").eq(recipient),
+                Limit=limit,
+            )
+            return resp.get("Items", [])
+        except Exception as e:
+            print(f"[WARN] digest queue query failed for {recipient}: {e}")
+            return []
+
+    def claim_digest(self, tid):
+        """Claim a queued ticket for this flush's digest; False if another flush holds it."""
+        now = int(self.clock())
+        try:
+            self.table.update_item(
+                Key={"id": tid},
+                UpdateExpression="SET #st = :sending, claimed_at = :now",
+                ConditionExpression="#st = :queued OR (#st = :sending AND claimed_at < :stale)",
+                ExpressionAttributeNames={"#st": "status"},
+                ExpressionAttributeValues={
+                    ":sending": SENDING,
+                    ":queued": QUEUED,
+                    ":now": now,
+                    ":stale": now - self.pending_timeout,
+                },
+            )
+            return True
+        except Exception as e:
+            if not _conditional_failed(e):
+                print(f"[WARN] digest claim failed for {tid}: {e}")
+            return False
+
+    def release_digest(self, tid):
+        """Return a claimed ticket whose digest was not sent to the queue."""
+        try:
+            self.table.update_item(
+                Key={"id": tid},
+                UpdateExpression="SET #st = :queued REMOVE claimed_at",
+                ConditionExpression="#st = :sending",
+                ExpressionAttributeNames={"#st": "status"},
+                ExpressionAttributeValues={":queued": QUEUED, ":sending": SENDING},
+            )
+        except Exception as e:
+            if not _conditional_failed(e):
+                print(f"[WARN] digest release failed for {tid}: {e}")
+
+    def _set_status(self, tid, status, message_id=None):
+        values = {":st": status}
+        expression = "SET #st = :st"
+        if message_id:
+            values[":mid"] = message_id
+            expression += ", message_id = :mid"
+        # Leaves the digest index once the ticket is no longer queued
+        expression += " REMOVE digest_recipient"
+        try:
+            self.table.update_item(
+                Key={"id": tid},
+                UpdateExpression=expression,
+                ExpressionAttributeNames={"#st": "status"},
+                ExpressionAttributeValues=values,
+            )
+        except Exception as e:
+            print(f"[WARN] escalation ledger status update failed for {tid}: {e}")
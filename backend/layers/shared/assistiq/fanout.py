@@ -0,0 +1,37 @@
+"""
+Concurrent fan-out for independent blocking calls (DynamoDB, SES, SQS).
+
+A module-level thread pool stays warm across invocations of a container.
+`gather` runs zero-argument callables on it and joins them against a
+deadline, so a handler waits for its slowest call instead of the sum of
+them. Calls that miss the deadline keep running in the background; their
+results are dropped.
+
+boto3 clients are thread-safe. Do not call `gather` from inside a gathered
+call: the inner calls could wait for pool threads held by the outer ones.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor, wait
+
+MAX_WORKERS = int(os.environ.get("FANOUT_MAX_WORKERS", "8"))
+DEFAULT_TIMEOUT = float(os.environ.get("FANOUT_TIMEOUT_SECONDS", "3.0"))
+
+_pool = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="assistiq-fanout")
+
+class FanoutTimeout(Exception):
+    pass
+
+def gather(*calls, timeout=None):
+    """Results of `calls`, run concurrently, in call order.
+
+    Raises the first failed call's exception, or FanoutTimeout if they are
+    not all done within `timeout` seconds (default FANOUT_TIMEOUT_SECONDS).
+    A single call without an explicit timeout runs inline.
+    """
+    if len(calls) == 1 and timeout is None:
+        return [calls[0]()]
+    futures = [_pool.submit(call) for call in calls]
+    _, pending = wait(futures, timeout=DEFAULT_TIMEOUT if timeout is None else timeout)
+    if pending:
+        raise FanoutTimeout(f"{len(pending)} of {len(futures)} calls still running")
+    return [f.result() for f in futures]
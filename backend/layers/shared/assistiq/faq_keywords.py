@@ -0,0 +1,151 @@
+"""
+Multi-pattern FAQ keyword matcher (Aho-Corasick).
+
+Every `q_keywords` phrase from the FAQ items is compiled into one automaton,
+so a message is matched against all keywords in a single pass over its
+characters. Text and keywords are normalised the same way (NFKC, lower case,
+punctuation folded to single spaces) and padded with spaces, so keywords only
+match on word boundaries ("mail" does not match inside "email").
+
+Items can be added, changed or removed one at a time; only the trie gains
+nodes, and the failure links are recomputed lazily before the next match.
+"""
+import re
+import unicodedata
+from collections import deque
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+def normalize(text):
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    text = text.replace("’", "'").replace("'", "")
+    return " ".join(_TOKEN_RE.findall(text))
+
+class KeywordMatcher:
+    def __init__(self, faqs=()):
+        self._goto = [{}]
+        self._fail = [0]
+        self._terminal = [None]     # keyword ending at the node, if any
+        self._dict_link = [0]       # nearest proper suffix node that ends a keyword
+        self._links_dirty = False
+        self._owners = {}           # keyword -> set of FAQ ids
+        self._items = {}            # FAQ id -> item
+        self._item_keywords = {}    # FAQ id -> set of keywords
+        self.sync(faqs)
+
+    def __len__(self):
+        return len(self._items)
+
+    # ---------- incremental maintenance ----------
+
+    def set_item(self, faq):
+        """Add or replace one FAQ item (needs `id`, `q_keywords`, `answer`)."""
+        faq_id = str(faq["id"])
+        keywords = {normalize(k) for k in faq.get("q_keywords") or []}
+        keywords.discard("")
+        self.remove_item(faq_id)
+        self._items[faq_id] = faq
+        self._item_keywords[faq_id] = keywords
+        for kw in keywords:
+            if kw not in self._owners:
+                self._owners[kw] = set()
+                self._insert(kw)
+            self._owners[kw].add(faq_id)
+
+    def remove_item(self, faq_id):
+        faq_id = str(faq_id)
+        self._items.pop(faq_id, None)
+        for kw in self._item_keywords.pop(faq_id, ()):
+            owners = self._owners.get(kw)
+            if owners:
+                owners.discard(faq_id)
+
+    def sync(self, faqs):
+        """Apply only the differences between the current items and `faqs`."""
+        wanted = {str(f["id"]): f for f in faqs if f.get("id") is not None}
+        for faq_id in list(self._items):
+            if faq_id not in wanted:
+                self.remove_item(faq_id)
+        for faq_id, faq in wanted.items():
+            if self._items.get(faq_id) != faq:
+                self.set_item(faq)
+
+    def _insert(self, keyword):
+        node = 0
+        for ch in f" {keyword} ":
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._terminal.append(None)
+                self._dict_link.append(0)
+            node = nxt
+        self._terminal[node] = keyword
+        self._links_dirty = True
+
+    def _build_links(self):
+        queue = deque()
+        for nxt in self._goto[0].values():
+            self._fail[nxt] = 0
+            self._dict_link[nxt] = 0
+            queue.append(nxt)
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                f = self._goto[f].get(ch, 0)
+                self._fail[nxt] = f
+                self._dict_link[nxt] = f if self._terminal[f] is not None else self._dict_link[f]
+                queue.append(nxt)
+        self._links_dirty = False
+
+    # ---------- matching ----------
+
+    def find(self, text):
+        """Set of keywords occurring in `text` (single pass)."""
+        if self._links_dirty:
+            self._build_links()
+        found = set()
+        goto, fail, terminal, dict_link = self._goto, self._fail, self._terminal, self._dict_link
+        node = 0
+        for ch in f" {normalize(text)} ":
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            out = node if terminal[node] is not None else dict_link[node]
+            while out:
+                found.add(terminal[out])
+                out = dict_link[out]
+        return found
+
+    def match(self, text, top_k=3):
+        """Ranked FAQ answers for `text`.
+
+        Each result is a dict with the FAQ `id`, `answer`, the matched
+        `keywords`, a `score` (words matched, longer phrases count more) and
+        `coverage`, the share of the message's words covered by those keywords.
+        """
+        words = normalize(text).split()
+        if not words:
+            return []
+        scores = {}
+        for kw in self.find(text):
+            for faq_id in self._owners.get(kw, ()):
+                scores.setdefault(faq_id, set()).add(kw)
+
+        results = []
+        for faq_id, kws in scores.items():
+            covered = {w for kw in kws for w in kw.split()}
+            results.append({
+                "id": faq_id,
+                "answer": self._items[faq_id].get("answer"),
+                "keywords": sorted(kws),
+                "score": sum(len(kw.split()) for kw in kws),
+                "coverage": sum(1 for w in words if w in covered) / len(words),
+            })
+        results.sort(key=lambda r: (r["score"], r["coverage"]), reverse=True)
+        return results[:top_k]
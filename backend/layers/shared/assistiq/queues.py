@@ -0,0 +1,73 @@
+"""
+Durable work queues between the AssistIQ functions.
+
+In AWS the queues are SQS (the URL comes from an environment variable). When
+that variable is not set, for local runs and tests, an in-memory LocalQueue
+stands in; `drain_event()` hands its messages over in the same event shape
+Lambda's SQS trigger uses, so the consuming handler can be called directly.
+"""
+import os
+import json
+import uuid
+import boto3
+
+# SendMessageBatch accepts at most 10 entries
+_SQS_BATCH = 10
+
+class SqsQueue:
+    def __init__(self, url, client=None, config=None):
+        self.url = url
+        self.client = client or boto3.client("sqs", config=config)
+
+    def send(self, message, delay_seconds=0):
+        self.client.send_message(
+            QueueUrl=self.url,
+            MessageBody=json.dumps(message, default=str),
+            DelaySeconds=delay_seconds,
+        )
+
+    def send_batch(self, messages):
+        """Send messages in chunks of 10; returns the ones SQS did not accept."""
+        failed = []
+        for start in range(0, len(messages), _SQS_BATCH):
+            chunk = messages[start:start + _SQS_BATCH]
+            resp = self.client.send_message_batch(
+                QueueUrl=self.url,
+                Entries=[{"Id": str(i), "MessageBody": json.dumps(m, default=str)} for i, m in enumerate(chunk)],
+            )
+            failed += [chunk[int(f["Id"])] for f in resp.get("Failed", [])]
+        return failed
+
+class LocalQueue:
+    def __init__(self):
+        self.messages = []
+
+    def send(self, message, delay_seconds=0):
+        self.messages.append(json.loads(json.dumps(message, default=str)))
+
+    def send_batch(self, messages):
+        for m in messages:
+            self.send(m)
+        return []
+
+    def drain_event(self):
+        """Remove all queued messages and return them as an SQS trigger event."""
+        records = [
+            {"messageId": str(uuid.uuid4()), "body": json.dumps(m), "eventSource": "aws:sqs"}
+            for m in self.messages
+        ]
+        self.messages = []
+        return {"Records": records}
+
+def queue_from_env(var_name, config=None):
+    """`config` is the botocore Config for the SQS client (see budget.client_config)."""
+    url = os.environ.get(var_name)
+    if url:
+        return SqsQueue(url, config=config)
+    print(f"[WARN] {var_name} not set; using an in-memory LocalQueue")
+    return LocalQueue()
+
+def sqs_messages(event):
+    """(messageId, decoded body) pairs from an SQS trigger event."""
+    for record in event.get("Records", []):
+        yield record.get("messageId"), json.loads(record.get("body") or "{}")
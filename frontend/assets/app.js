@@ -46,14 +46,13 @@ window.ASSISTIQ_API_ENDPOINT =
   window.ASSISTIQ_API_ENDPOINT ||
   "https://oz5ieiw1zb.execute-api.us-east-1.amazonaws.com/chat";
 
-// Persistent sessionId stored in sessionStorage
-let sessionId = sessionStorage.getItem("assistiq_sessionId");
-if (!sessionId) {
-  sessionId = crypto.randomUUID
-    ? crypto.randomUUID()
-    : "sess-" + Math.random().toString(36).substr(2, 9);
-  sessionStorage.setItem("assistiq_sessionId", sessionId);
-}
+// Persistent sessionId stored in sessionStorage. The first message is sent
+// without one: the proxy mints it (so the backend knows the session is new
+// and skips looking up its state) and we adopt the one it returns.
+let sessionId = sessionStorage.getItem("assistiq_sessionId") || null;
+
+// Last turn the server has sent us; the API only returns newer turns
+let historyCursor = sessionStorage.getItem("assistiq_cursor") || null;
 
 const fab = $("#chatFab");
 const chatContainer = $("#chatContainer");
@@ -140,11 +139,24 @@ function buildChat() {
     }
 
     try {
-      const res = await fetch(endpoint, {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ text, sessionId }),
-      });
+      const payload = sessionId
+        ? { text, sessionId, cursor: historyCursor }
+        : { text, cursor: historyCursor };
+      let res;
+      // A Lex timeout (504 + retryable) is retried once with the same turn
+      // id, so a turn the bot finished anyway is not run twice
+      for (let attempt = 0; attempt < 2; attempt++) {
+        res = await fetch(endpoint, {
+          method: "POST",
+          headers: { "Content-Type": "application/json" },
+          body: JSON.stringify(payload),
+        });
+        if (res.status !== 504 || attempt > 0) break;
+        const retry = await res.clone().json().catch(() => ({}));
+        if (!retry.retryable || !retry.turnId) break;
+        payload.turnId = retry.turnId;
+        if (retry.sessionId) payload.sessionId = retry.sessionId;
+      }
 
       if (!res.ok) {
         const errText = await res.text().catch(() => "");
@@ -157,6 +169,14 @@ function buildChat() {
       }
 
       const data = await res.json().catch(() => ({}));
+      if (!sessionId && data.sessionId) {
+        sessionId = data.sessionId;
+        sessionStorage.setItem("assistiq_sessionId", sessionId);
+      }
+      if (data.cursor) {
+        historyCursor = data.cursor;
+        sessionStorage.setItem("assistiq_cursor", historyCursor);
+      }
       const answer = data.answer || data.message || "…";
       appendMsg(answer, "bot");
       persist("bot", answer);
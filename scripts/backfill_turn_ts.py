@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Backfill the `turn_ts` attribute on existing ChatLogs rows so they show up
+in the SessionTurnsIndex (HASH session_id, RANGE turn_ts).
+
+The scan position is saved to a checkpoint file after every page, so an
+interrupted run picks up where it stopped. Rows that already have
+`turn_ts` are skipped and updates are conditional, so re-running is safe.
+
+Usage:
+  python3 scripts/backfill_turn_ts.py AssistIQ-ChatLogs
+  LOGS_TABLE=AssistIQ-ChatLogs python3 scripts/backfill_turn_ts.py
+
+  # optional: checkpoint path (default: .backfill_turn_ts.json) and page size
+  CHECKPOINT=/tmp/backfill.json PAGE_SIZE=200 python3 scripts/backfill_turn_ts.py AssistIQ-ChatLogs
+"""
+import sys, os, json, boto3
+from datetime import datetime
+from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
+
+TS_FORMATS = ("%Y-%m-%dT%H:%M:%S.%f", "%Y-%m-%dT%H:%M:%S")
+
+def to_turn_ts(timestamp):
+    """Normalise the legacy `timestamp` formats to the sortable turn_ts format."""
+    raw = (timestamp or "").rstrip("Z")
+    for fmt in TS_FORMATS:
+        try:
+            return datetime.strptime(raw, fmt).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+        except ValueError:
+            continue
+    return None
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f).get("last_evaluated_key")
+
+def save_checkpoint(path, last_key, stats):
+    tmp = path + ".tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({"last_evaluated_key": last_key, **stats}, f)
+    os.replace(tmp, path)
+
+def main():
+    table_name = os.environ.get("LOGS_TABLE") or (sys.argv[1] if len(sys.argv) > 1 else None)
+    if not table_name:
+        print("Usage: python3 scripts/backfill_turn_ts.py <ChatLogsTableName>")
+        sys.exit(1)
+    checkpoint = os.environ.get("CHECKPOINT", ".backfill_turn_ts.json")
+    page_size = int(os.environ.get("PAGE_SIZE", "500"))
+
+    table = boto3.resource('dynamodb').Table(table_name)
+    kwargs = {
+        "FilterExpression": Attr("turn_ts").not_exists() & Attr("session_id").exists(),
+        "ProjectionExpression": "id, #ts",
+        "ExpressionAttributeNames": {"#ts": "timestamp"},
+        "Limit": page_size,
+    }
+    start_key = load_checkpoint(checkpoint)
+    if start_key:
+        print("Resuming from checkpoint:", start_key)
+        kwargs["ExclusiveStartKey"] = start_key
+
+    stats = {"updated": 0, "skipped": 0}
+    while True:
+        resp = table.scan(**kwargs)
+        for it in resp.get("Items", []):
+            turn_ts = to_turn_ts(it.get("timestamp"))
+            if not it.get("id") or not turn_ts:
+                print("Skipping row without id/timestamp:", it)
+                stats["skipped"] += 1
+                continue
+            try:
+                table.update_item(
+                    Key={"id": it["id"]},
+                    UpdateExpression="SET turn_ts = :t",
+                    ConditionExpression="attribute_not_exists(turn_ts)",
+                    ExpressionAttributeValues={":t": turn_ts},
+                )
+                stats["updated"] += 1
+            except ClientError as e:
+                if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                    raise
+                stats["skipped"] += 1
+
+        last_key = resp.get("LastEvaluatedKey")
+        save_checkpoint(checkpoint, last_key, stats)
+        if not last_key:
+            break
+        kwargs["ExclusiveStartKey"] = last_key
+
+    os.remove(checkpoint)
+    print(f"Backfill complete: {stats['updated']} updated, {stats['skipped']} skipped")
+
+if __name__ == "__main__":
+    main()
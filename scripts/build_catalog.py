@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Compile scripts/intents.json and scripts/seed_faq.json into the read-only
+catalog snapshot shipped in the SharedLayer (run before `sam build`).
+
+Usage:
+  python3 scripts/build_catalog.py                 # writes backend/layers/shared/assistiq/catalog.snap
+  python3 scripts/build_catalog.py /path/out.snap
+"""
+import sys, os, json
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "backend", "layers", "shared"))
+from assistiq.catalog_snapshot import compile_snapshot, catalog_version, CatalogSnapshot, DEFAULT_PATH
+
+def load_json(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def load_catalog():
+    scripts = os.path.join(ROOT, "scripts")
+    return load_json(os.path.join(scripts, "intents.json")), load_json(os.path.join(scripts, "seed_faq.json"))
+
+def main():
+    out = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_PATH
+    intents, faqs = load_catalog()
+    data = compile_snapshot(intents, faqs)
+
+    tmp = out + ".tmp"
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, out)
+
+    snap = CatalogSnapshot.open(out)
+    assert snap.version == catalog_version(intents, faqs)
+    print(f"Wrote {out}: {snap.count} records, {len(data)} bytes, version {snap.version}")
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,9 @@
 set -euo pipefail
 PROJECT=AssistIQ
 
+echo "=== Compiling intent/FAQ catalog snapshot ==="
+python3 scripts/build_catalog.py
+
 echo "=== Building & deploying backend with SAM ==="
 # sam build
 # sam deploy --guided
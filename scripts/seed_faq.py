@@ -1,6 +1,8 @@
 
 #!/usr/bin/env python3
 import boto3, json, sys, os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from build_catalog import load_catalog, catalog_version
 table_name = os.environ.get("FAQ_TABLE") or sys.argv[1] if len(sys.argv)>1 else None
 if not table_name:
   print("Usage: FAQ_TABLE=<name> python3 scripts/seed_faq.py or python3 scripts/seed_faq.py <table>"); exit(1)
@@ -9,4 +11,6 @@ t = ddb.Table(table_name)
 items = json.load(open('scripts/seed_faq.json'))
 for it in items:
   t.put_item(Item=it)
+# publish the catalog version; it matches the bundled snapshot when the seeds are unchanged
+t.put_item(Item={"id": "__catalog_version__", "version": catalog_version(*load_catalog())})
 print(f"Seeded {len(items)} items into {table_name}")
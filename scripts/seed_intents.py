@@ -11,6 +11,8 @@ Usage:
 """
 import sys, os, json, boto3
 from botocore.exceptions import ClientError
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from build_catalog import load_catalog, catalog_version
 
 def load_json(path):
     with open(path, 'r', encoding='utf-8') as f:
@@ -43,5 +45,10 @@ def main():
         except ClientError as e:
             print("Failed to put item", it["id"], e)
 
+    # publish the catalog version; it matches the bundled snapshot when the seeds are unchanged
+    version = catalog_version(*load_catalog())
+    table.put_item(Item={"id": "__catalog_version__", "version": version})
+    print("Catalog version:", version)
+
 if __name__ == "__main__":
     main()
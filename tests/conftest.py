@@ -0,0 +1,15 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The Lambdas import the SharedLayer as `assistiq` and their own modules by
+# name, as they do once deployed
+for path in (
+    os.path.join(ROOT, "backend", "layers", "shared"),
+    os.path.join(ROOT, "backend", "functions", "fulfillment"),
+    os.path.join(ROOT, "backend", "functions", "escalation_worker"),
+    os.path.dirname(os.path.abspath(__file__)),
+):
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,241 @@
+"""
+In-memory DynamoDB Table stand-in for the tests.
+
+Evaluates the subset of condition and update expressions the AssistIQ code
+uses (comparisons, attribute_exists / attribute_not_exists / contains,
+AND / OR / NOT, SET with if_not_exists, REMOVE, ADD), so conditional writes
+fail the way DynamoDB fails them: with a ConditionalCheckFailedException.
+"""
+import re
+import copy
+from botocore.exceptions import ClientError
+
+_TOKEN_RE = re.compile(r"\s*(<>|<=|>=|[=<>(),]|[#:]?[A-Za-z_][A-Za-z0-9_.]*)")
+
+def conditional_failed():
+    return ClientError({"Error": {"Code": "ConditionalCheckFailedException", "Message": "failed"}}, "UpdateItem")
+
+def _tokens(expression):
+    out, pos = [], 0
+    expression = expression.strip()
+    while pos < len(expression):
+        m = _TOKEN_RE.match(expression, pos)
+        if not m:
+            raise ValueError(f"cannot parse {expression[pos:]!r}")
+        out.append(m.group(1))
+        pos = m.end()
+    return out
+
+class _Condition:
+    def __init__(self, expression, names, values, item):
+        self.toks = _tokens(expression)
+        self.i = 0
+        self.names = names or {}
+        self.values = values or {}
+        self.item = item
+
+    def evaluate(self):
+        result = self._or()
+        assert self.i == len(self.toks), self.toks[self.i:]
+        return result
+
+    def _peek(self):
+        return self.toks[self.i] if self.i < len(self.toks) else None
+
+    def _take(self, expected=None):
+        tok = self.toks[self.i]
+        if expected is not None and tok.upper() != expected:
+            raise ValueError(f"expected {expected}, got {tok}")
+        self.i += 1
+        return tok
+
+    def _or(self):
+        result = self._and()
+        while (self._peek() or "").upper() == "OR":
+            self._take()
+            right = self._and()
+            result = result or right
+        return result
+
+    def _and(self):
+        result = self._not()
+        while (self._peek() or "").upper() == "AND":
+            self._take()
+            right = self._not()
+            result = result and right
+        return result
+
+    def _not(self):
+        if (self._peek() or "").upper() == "NOT":
+            self._take()
+            return not self._not()
+        return self._atom()
+
+    def _path(self, tok):
+        return self.names.get(tok, tok)
+
+    def _operand(self):
+        tok = self._take()
+        if tok.startswith(":"):
+            return self.values[tok]
+        return self.item.get(self._path(tok))
+
+    def _atom(self):
+        tok = self._peek()
+        if tok == "(":
+            self._take()
+            result = self._or()
+            self._take(")")
+            return result
+        if tok in ("attribute_exists", "attribute_not_exists", "contains"):
+            self._take()
+            self._take("(")
+            path = self._path(self._take())
+            if tok == "contains":
+                self._take(",")
+                needle = self._operand()
+                self._take(")")
+                return needle in (self.item.get(path) or ())
+            self._take(")")
+            return (path in self.item) == (tok == "attribute_exists")
+        left = self._operand()
+        op = self._take()
+        right = self._operand()
+        if left is None or right is None:
+            return op == "<>" and left != right
+        return {
+            "=": left == right, "<>": left != right, "<": left < right,
+            "<=": left <= right, ">": left > right, ">=": left >= right,
+        }[op]
+
+def _split_top(text):
+    parts, depth, start = [], 0, 0
+    for i, ch in enumerate(text):
+        depth += ch == "("
+        depth -= ch == ")"
+        if ch == "," and depth == 0:
+            parts.append(text[start:i].strip())
+            start = i + 1
+    parts.append(text[start:].strip())
+    return [p for p in parts if p]
+
+def _apply_update(item, expression, names, values):
+    names = names or {}
+    values = values or {}
+    name = lambda tok: names.get(tok, tok)
+    for clause, body in re.findall(r"(SET|REMOVE|ADD|DELETE)\s+(.*?)(?=\s+(?:SET|REMOVE|ADD|DELETE)\s|$)",
+                                   expression.strip(), re.S):
+        for action in _split_top(body):
+            if clause == "SET":
+                path, rhs = [p.strip() for p in action.split("=", 1)]
+                m = re.match(r"if_not_exists\(\s*(\S+)\s*,\s*(\S+)\s*\)$", rhs)
+                if m:
+                    value = item.get(name(m.group(1)), values[m.group(2)])
+                elif "+" in rhs:
+                    a, b = [x.strip() for x in rhs.split("+", 1)]
+                    value = (item.get(name(a), 0) if not a.startswith(":") else values[a]) + values[b]
+                else:
+                    value = values[rhs] if rhs.startswith(":") else item.get(name(rhs))
+                item[name(path)] = copy.deepcopy(value)
+            elif clause == "REMOVE":
+                item.pop(name(action), None)
+            else:
+                path, operand = action.split()
+                value = values[operand]
+                current = item.get(name(path))
+                if clause == "ADD":
+                    item[name(path)] = (set(current) | set(value)) if isinstance(value, set) else (current or 0) + value
+                elif current is not None:
+                    item[name(path)] = set(current) - set(value)
+
+class _BatchWriter:
+    def __init__(self, table):
+        self.table = table
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def put_item(self, Item):
+        self.table.put_item(Item=Item)
+
+class FakeTable:
+    """Table with hash key `id` and an optional range key; `indexes` maps index name -> hash attribute."""
+
+    def __init__(self, name="table", range_key=None, indexes=None):
+        self.name = name
+        self.range_key = range_key
+        self.indexes = indexes or {}
+        self.items = {}
+        self.calls = []
+
+    def _key(self, key_or_item):
+        if self.range_key:
+            return key_or_item["id"], key_or_item[self.range_key]
+        return key_or_item["id"]
+
+    def _check(self, item, kwargs):
+        condition = kwargs.get("ConditionExpression")
+        if condition and not _Condition(condition, kwargs.get("ExpressionAttributeNames"),
+                                        kwargs.get("ExpressionAttributeValues"), item or {}).evaluate():
+            raise conditional_failed()
+
+    def get(self, item_id, sort=None):
+        return self.items.get((item_id, sort) if self.range_key else item_id)
+
+    def get_item(self, Key, **kwargs):
+        item = self.items.get(self._key(Key))
+        return {"Item": copy.deepcopy(item)} if item is not None else {}
+
+    def put_item(self, Item, **kwargs):
+        self.calls.append(("put_item", Item, kwargs))
+        self._check(self.items.get(self._key(Item)), kwargs)
+        self.items[self._key(Item)] = copy.deepcopy(Item)
+        return {}
+
+    def update_item(self, Key, UpdateExpression, ReturnValues=None, **kwargs):
+        self.calls.append(("update_item", Key, UpdateExpression, kwargs))
+        current = self.items.get(self._key(Key))
+        self._check(current, kwargs)
+        item = copy.deepcopy(current) if current is not None else dict(Key)
+        _apply_update(item, UpdateExpression, kwargs.get("ExpressionAttributeNames"),
+                      kwargs.get("ExpressionAttributeValues"))
+        self.items[self._key(Key)] = item
+        if ReturnValues in ("ALL_NEW", "UPDATED_NEW"):
+            return {"Attributes": copy.deepcopy(item)}
+        return {}
+
+    def delete_item(self, Key, **kwargs):
+        self._check(self.items.get(self._key(Key)), kwargs)
+        self.items.pop(self._key(Key), None)
+        return {}
+
+    def query(self, KeyConditionExpression, IndexName=None, ScanIndexForward=True, Limit=None, **kwargs):
+        """Equality on the hash key (boto3 Key(...).eq(...)); ordered by the range key."""
+        attribute = KeyConditionExpression._values[0].name
+        value = KeyConditionExpression._values[1]
+        if IndexName is not None:
+            assert self.indexes[IndexName] == attribute, IndexName
+        matches = [copy.deepcopy(i) for i in self.items.values() if i.get(attribute) == value]
+        if self.range_key:
+            matches.sort(key=lambda i: i[self.range_key], reverse=not ScanIndexForward)
+        return {"Items": matches[:Limit] if Limit else matches}
+
+    def batch_writer(self):
+        return _BatchWriter(self)
+
+class FakeDynamoDB:
+    """Client stand-in serving `batch_get_item` from FakeTables (hash key `id` only)."""
+
+    def __init__(self, *tables):
+        self.tables = {t.name: t for t in tables}
+
+    def batch_get_item(self, RequestItems):
+        responses = {}
+        for name, request in RequestItems.items():
+            table = self.tables[name]
+            found = [table.get_item(Key=key).get("Item") for key in request["Keys"]]
+            responses[name] = [item for item in found if item is not None]
+        return {"Responses": responses, "UnprocessedKeys": {}}
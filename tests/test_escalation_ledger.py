@@ -0,0 +1,130 @@
+import pytest
+from fake_dynamodb import FakeTable
+from assistiq.escalation_ledger import (
+    EscalationLedger, DIGEST_INDEX, PENDING, QUEUED, SENDING, SENT, ticket_id,
+)
+
+class Clock:
+    def __init__(self, now=1_000_000):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+@pytest.fixture
+def table():
+    return FakeTable("EscalationLedger", indexes={DIGEST_INDEX: "digest_recipient"})
+
+@pytest.fixture
+def ledger(table, clock):
+    return EscalationLedger(table, window_seconds=3600, pending_timeout=90, clock=clock)
+
+def test_open_claims_a_pending_ticket(ledger, table):
+    item = ledger.open("s1", "VPNIssue", "t1")
+    assert item["status"] == PENDING
+    assert item["turn_ids"] == {"t1"}
+    assert table.get(ticket_id("s1", "VPNIssue"))["status"] == PENDING
+
+def test_open_returns_none_while_a_ticket_is_live(ledger, clock):
+    ledger.open("s1", "VPNIssue", "t1")
+    clock.now += 30
+    assert ledger.open("s1", "VPNIssue", "t2") is None
+    # Another issue for the same session is a ticket of its own
+    assert ledger.open("s1", "WifiIssue", "t2") is not None
+
+def test_open_after_the_window_starts_a_new_ticket(ledger, table, clock):
+    ledger.open("s1", "VPNIssue", "t1")
+    ledger.mark_sent(ticket_id("s1", "VPNIssue"), "msg-1")
+    clock.now += 3601
+    item = ledger.open("s1", "VPNIssue", "t2")
+    assert item["status"] == PENDING
+    assert table.get(ticket_id("s1", "VPNIssue"))["turn_ids"] == {"t2"}
+
+def test_append_records_each_turn_once(ledger, table):
+    ledger.open("s1", "VPNIssue", "t1")
+    assert ledger.append("s1", "VPNIssue", "t2") is True
+    # A retry of the same turn is a no-op
+    assert ledger.append("s1", "VPNIssue", "t2") is False
+    stored = table.get(ticket_id("s1", "VPNIssue"))
+    assert stored["turn_ids"] == {"t1", "t2"}
+    assert stored["updates"] == 1
+
+def test_append_without_a_ticket_is_rejected(ledger, table):
+    assert ledger.append("s1", "VPNIssue", "t1") is False
+    assert table.get(ticket_id("s1", "VPNIssue")) is None
+
+def test_failed_ticket_is_reclaimed_keeping_its_turns(ledger, table, clock):
+    ledger.open("s1", "VPNIssue", "t1")
+    ledger.mark_failed(ticket_id("s1", "VPNIssue"))
+    clock.now += 10
+    item = ledger.open("s1", "VPNIssue", "t2")
+    assert item["status"] == PENDING
+    assert item["turn_ids"] == {"t1", "t2"}
+    assert table.get(ticket_id("s1", "VPNIssue"))["opened_at"] == clock.now
+
+def test_stale_pending_ticket_is_reclaimed(ledger, clock):
+    ledger.open("s1", "VPNIssue", "t1")
+    clock.now += 60
+    assert ledger.open("s1", "VPNIssue", "t2") is None
+    clock.now += 60
+    item = ledger.open("s1", "VPNIssue", "t3")
+    assert item is not None
+    assert item["turn_ids"] == {"t1", "t3"}
+
+def test_sent_ticket_is_not_reclaimed(ledger, clock):
+    ledger.open("s1", "VPNIssue", "t1")
+    ledger.mark_sent(ticket_id("s1", "VPNIssue"))
+    clock.now += 600
+    assert ledger.open("s1", "VPNIssue", "t2") is None
+
+def test_digest_ticket_waits_queued_for_its_recipient(ledger):
+    item = ledger.open("s1", "VPNIssue", "t1", digest_recipient="it@example.com")
+    assert item["status"] == QUEUED
+    assert [t["id"] for t in ledger.queued("it@example.com")] == [ticket_id("s1", "VPNIssue")]
+    assert ledger.queued("other@example.com") == []
+
+def test_digest_claim_is_exclusive_until_stale(ledger, table, clock):
+    ledger.open("s1", "VPNIssue", "t1", digest_recipient="it@example.com")
+    tid = ticket_id("s1", "VPNIssue")
+    assert ledger.claim_digest(tid) is True
+    assert table.get(tid)["status"] == SENDING
+    # A concurrent flush must not take it
+    assert ledger.claim_digest(tid) is False
+    clock.now += 91
+    assert ledger.claim_digest(tid) is True
+    assert table.get(tid)["claimed_at"] == clock.now
+
+def test_released_digest_ticket_is_queued_again(ledger, table):
+    ledger.open("s1", "VPNIssue", "t1", digest_recipient="it@example.com")
+    tid = ticket_id("s1", "VPNIssue")
+    ledger.claim_digest(tid)
+    ledger.release_digest(tid)
+    stored = table.get(tid)
+    assert stored["status"] == QUEUED
+    assert "claimed_at" not in stored
+    assert ledger.claim_digest(tid) is True
+
+def test_sent_digest_ticket_leaves_the_queue(ledger, table):
+    ledger.open("s1", "VPNIssue", "t1", digest_recipient="it@example.com")
+    tid = ticket_id("s1", "VPNIssue")
+    ledger.claim_digest(tid)
+    ledger.mark_sent(tid, "msg-1")
+    assert table.get(tid)["status"] == SENT
+    assert ledger.queued("it@example.com") == []
+    # Releasing after the send changes nothing
+    ledger.release_digest(tid)
+    assert table.get(tid)["status"] == SENT
+
+def test_failed_digest_ticket_is_reclaimed_into_the_queue(ledger, clock):
+    ledger.open("s1", "VPNIssue", "t1", digest_recipient="it@example.com")
+    ledger.mark_failed(ticket_id("s1", "VPNIssue"))
+    assert ledger.queued("it@example.com") == []
+    clock.now += 10
+    item = ledger.open("s1", "VPNIssue", "t2", digest_recipient="it@example.com")
+    assert item["status"] == QUEUED
+    assert item["turn_ids"] == {"t1", "t2"}
+    assert [t["status"] for t in ledger.queued("it@example.com")] == [QUEUED]
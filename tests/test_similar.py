@@ -0,0 +1,85 @@
+import pytest
+from fake_dynamodb import FakeDynamoDB, FakeTable
+from similar import (
+    BANDS, BUCKET_QUERY_LIMIT, DynamoLSHStore, LocalLSHStore, band_keys, shingles, signature,
+)
+
+VPN = "my vpn keeps disconnecting every few minutes when I work from home"
+VPN_AGAIN = "the vpn keeps disconnecting every few minutes when working from home today"
+PRINTER = "the printer on the third floor is out of toner and jams on every page"
+
+class Clock:
+    def __init__(self, now=1_700_000_000):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+def sig(text):
+    return signature(shingles(text))
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+@pytest.fixture
+def tables():
+    return FakeTable("SimilarTickets"), FakeTable("SimilarTicketBuckets", range_key="member")
+
+@pytest.fixture(params=["local", "dynamodb"])
+def store(request, tables, clock):
+    if request.param == "local":
+        return LocalLSHStore()
+    tickets, buckets = tables
+    return DynamoLSHStore(tickets, buckets, FakeDynamoDB(tickets), clock=clock)
+
+def test_signature_of_nothing_is_none():
+    assert signature(shingles("")) is None
+    assert len(band_keys(sig(VPN))) == BANDS
+
+def test_similar_transcript_is_found(store):
+    store.add("t-vpn", sig(VPN), {"issue_type": "VPNIssue"})
+    store.add("t-printer", sig(PRINTER), {"issue_type": "PrinterIssue"})
+    found = store.query(sig(VPN_AGAIN))
+    assert [ticket["ticket_id"] for ticket, _ in found] == ["t-vpn"]
+    assert found[0][0]["issue_type"] == "VPNIssue"
+    assert 0.2 <= found[0][1] < 1.0
+
+def test_ticket_is_not_its_own_match(store):
+    store.add("t-vpn", sig(VPN), {})
+    assert store.query(sig(VPN), exclude="t-vpn") == []
+
+def test_unrelated_transcript_finds_nothing(store):
+    store.add("t-printer", sig(PRINTER), {})
+    assert store.query(sig(VPN)) == []
+
+def test_bucket_membership_is_one_item_per_band(tables, clock):
+    tickets, buckets = tables
+    store = DynamoLSHStore(tickets, buckets, FakeDynamoDB(tickets), clock=clock)
+    store.add("t1", sig(VPN), {})
+    clock.now += 1
+    store.add("t2", sig(VPN), {})
+    # Same signature, same buckets: each ticket is its own (bucket, member) item
+    assert len(buckets.items) == 2 * BANDS
+    key = band_keys(sig(VPN))[0]
+    members = sorted(m for bucket, m in buckets.items if bucket == key)
+    assert members == [f"{clock.now - 1:010d}#t1", f"{clock.now:010d}#t2"]
+
+def test_lookup_reads_only_the_newest_bucket_members(tables, clock):
+    tickets, buckets = tables
+    store = DynamoLSHStore(tickets, buckets, FakeDynamoDB(tickets), clock=clock)
+    for i in range(BUCKET_QUERY_LIMIT + 5):
+        store.add(f"t{i:02d}", sig(VPN), {})
+        clock.now += 1
+    newest = [f"t{i:02d}" for i in range(BUCKET_QUERY_LIMIT + 4, 4, -1)]
+    assert store._bucket(band_keys(sig(VPN))[0]) == newest
+    found = store.query(sig(VPN), k=BUCKET_QUERY_LIMIT + 5)
+    assert {ticket["ticket_id"] for ticket, _ in found} == set(newest)
+
+def test_local_store_reads_only_the_newest_bucket_members():
+    store = LocalLSHStore()
+    for i in range(BUCKET_QUERY_LIMIT + 5):
+        store.add(f"t{i:02d}", sig(VPN), {})
+    found = store.query(sig(VPN), k=BUCKET_QUERY_LIMIT + 5)
+    assert len(found) == BUCKET_QUERY_LIMIT
+    assert "t00" not in {ticket["ticket_id"] for ticket, _ in found}
@@ -0,0 +1,88 @@
+import pytest
+from fake_dynamodb import FakeDynamoDB, FakeTable
+from surge import DynamoCounterStore, LocalCounterStore, SurgeDetector
+
+class Clock:
+    def __init__(self, now=1_000_020):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+def detector(store, clock, **kwargs):
+    options = dict(window_seconds=300, bucket_seconds=60, baseline_windows=2,
+                   min_count=3, factor=3.0, incident_ttl=600, cache_seconds=30)
+    options.update(kwargs)
+    return SurgeDetector(store, {"WifiIssue"}, clock=clock, **options)
+
+@pytest.fixture(params=["local", "dynamodb"])
+def store(request):
+    if request.param == "local":
+        return LocalCounterStore()
+    table = FakeTable("Incidents")
+    return DynamoCounterStore(table, FakeDynamoDB(table))
+
+def test_unwatched_intent_is_not_counted(store, clock):
+    surge = detector(store, clock)
+    assert surge.observe("VPNIssue", "s1") == (None, False)
+    assert store.counts("VPNIssue", [int(clock.now // 60)]) == {int(clock.now // 60): 0}
+
+def test_threshold_crossing_opens_one_incident(store, clock):
+    surge = detector(store, clock)
+    assert surge.observe("WifiIssue", "s1") == (None, False)
+    assert surge.observe("WifiIssue", "s2") == (None, False)
+
+    incident, opened = surge.observe("WifiIssue", "s3")
+    assert opened is True
+    assert incident["status"] == "open"
+    assert incident["affected"] == 1
+
+    incident, opened = surge.observe("WifiIssue", "s4")
+    assert opened is False
+    assert incident["affected"] == 2
+    assert surge.open_incident("WifiIssue")["expires_at"] == int(clock.now) + 600
+
+def test_window_spans_earlier_buckets(store, clock):
+    surge = detector(store, clock)
+    surge.observe("WifiIssue", "s1")
+    clock.now += 60
+    surge.observe("WifiIssue", "s2")
+    clock.now += 60
+    _, opened = surge.observe("WifiIssue", "s3")
+    assert opened is True
+
+def test_requests_outside_the_window_do_not_add_up(store, clock):
+    surge = detector(store, clock)
+    surge.observe("WifiIssue", "s1")
+    surge.observe("WifiIssue", "s2")
+    clock.now += 300
+    assert surge.observe("WifiIssue", "s3") == (None, False)
+
+def test_busy_baseline_raises_the_threshold(store, clock):
+    surge = detector(store, clock)
+    current = int(clock.now // 60)
+    # Ten baseline buckets of 4 requests: 20 per window, so a surge needs 60
+    for bucket in range(current - 14, current - 4):
+        for _ in range(4):
+            store.incr("WifiIssue", bucket, 0)
+    for session in range(5):
+        assert surge.observe("WifiIssue", f"s{session}") == (None, False)
+
+def test_reports_attach_to_an_open_incident(store, clock):
+    surge = detector(store, clock)
+    for session in range(3):
+        surge.observe("WifiIssue", f"s{session}")
+    store.attach("WifiIssue", "s9")
+    assert store.incident("WifiIssue")["affected"] == 2
+
+def test_incident_lapses_after_its_ttl(store, clock):
+    surge = detector(store, clock)
+    for session in range(3):
+        surge.observe("WifiIssue", f"s{session}")
+    assert surge.open_incident("WifiIssue") is not None
+    clock.now += 601
+    assert surge.open_incident("WifiIssue") is None
@@ -0,0 +1,95 @@
+from datetime import datetime
+from botocore.exceptions import ClientError
+from fake_dynamodb import FakeTable
+from unit_of_work import UnitOfWork
+from assistiq import conversation_log
+
+class FakeClient:
+    """Records TransactWriteItems calls; `fail` makes them cancel."""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.transactions = []
+
+    def transact_write_items(self, TransactItems):
+        self.transactions.append(TransactItems)
+        if self.fail:
+            raise ClientError({"Error": {"Code": "TransactionCanceledException", "Message": "cancelled"}},
+                              "TransactWriteItems")
+        return {}
+
+def turn_update(turn_id, minute):
+    return conversation_log.turn_update(turn_id, "s1", user_text="vpn down", bot_reply="Forwarded to IT.",
+                                        intent_name="VPNIssue", confidence=1.0,
+                                        now=datetime(2024, 6, 11, 9, minute))
+
+def test_single_write_goes_out_as_a_plain_call():
+    client, sessions = FakeClient(), FakeTable("Sessions")
+    uow = UnitOfWork(client)
+    uow.put(sessions, {"id": "s1", "awaiting_closing": True})
+    assert uow.commit() is True
+    assert client.transactions == []
+    assert sessions.get("s1") == {"id": "s1", "awaiting_closing": True}
+
+def test_writes_commit_as_one_transaction():
+    client, sessions, chatlog = FakeClient(), FakeTable("Sessions"), FakeTable("ChatLogs")
+    uow = UnitOfWork(client)
+    update, ts = turn_update("turn-1", 0)
+    uow.update(chatlog, update, read_back=("turn_ts", ts))
+    uow.delete(sessions, {"id": "s1"})
+    assert uow.commit() is True
+    (items,) = client.transactions
+    assert sorted(next(iter(item)) for item in items) == ["Delete", "Update"]
+    update_item = next(item["Update"] for item in items if "Update" in item)
+    assert update_item["ConditionExpression"] == "attribute_not_exists(#rb)"
+    assert update_item["ExpressionAttributeNames"]["#rb"] == "turn_ts"
+    assert uow.stored[("ChatLogs", "turn-1")] == ts
+    assert len(uow) == 0
+
+def test_last_write_per_item_wins():
+    client, sessions = FakeClient(), FakeTable("Sessions")
+    uow = UnitOfWork(client)
+    uow.put(sessions, {"id": "s1", "awaiting_closing": True})
+    uow.delete(sessions, {"id": "s1"})
+    assert len(uow) == 1
+
+def test_failed_transaction_falls_back_to_individual_writes():
+    client, sessions, chatlog = FakeClient(fail=True), FakeTable("Sessions"), FakeTable("ChatLogs")
+    uow = UnitOfWork(client)
+    update, ts = turn_update("turn-1", 0)
+    uow.update(chatlog, update, read_back=("turn_ts", ts))
+    uow.put(sessions, {"id": "s1", "awaiting_closing": True, "intent_id": "VPNIssue"})
+    assert uow.commit(timeout=5) is True
+    assert len(client.transactions) == 1
+    assert chatlog.get("turn-1")["turn_ts"] == ts
+    assert sessions.get("s1")["intent_id"] == "VPNIssue"
+    assert uow.stored[("ChatLogs", "turn-1")] == ts
+
+def test_read_back_returns_the_turn_ts_already_stored():
+    client, sessions, chatlog = FakeClient(fail=True), FakeTable("Sessions"), FakeTable("ChatLogs")
+    first, first_ts = turn_update("turn-1", 0)
+    chatlog.update_item(**first)
+    # A retry of the turn a minute later keeps the first turn_ts
+    uow = UnitOfWork(client)
+    retry, retry_ts = turn_update("turn-1", 1)
+    assert retry_ts != first_ts
+    uow.update(chatlog, retry, read_back=("turn_ts", retry_ts))
+    uow.delete(sessions, {"id": "s1"})
+    assert uow.commit(timeout=5) is True
+    assert uow.stored[("ChatLogs", "turn-1")] == first_ts
+    assert chatlog.get("turn-1")["turn_ts"] == first_ts
+
+def test_one_failed_write_does_not_drop_the_others():
+    client, chatlog = FakeClient(fail=True), FakeTable("ChatLogs")
+
+    class BrokenTable(FakeTable):
+        def put_item(self, Item, **kwargs):
+            raise ClientError({"Error": {"Code": "ValidationException", "Message": "bad item"}}, "PutItem")
+
+    sessions = BrokenTable("Sessions")
+    uow = UnitOfWork(client)
+    update, ts = turn_update("turn-1", 0)
+    uow.update(chatlog, update, read_back=("turn_ts", ts))
+    uow.put(sessions, {"id": "s1"})
+    assert uow.commit(timeout=5) is False
+    assert chatlog.get("turn-1")["turn_ts"] == ts